@@ -0,0 +1,355 @@
+import json
+import os
+import shutil
+import time
+
+import cv2
+import numpy as np
+
+# Dışa aktarılan modellerin giriş boyutu (kare, dinamik parti)
+EXPORT_IMAGE_SIZE = 640
+PRECISIONS = ("fp32", "fp16", "int8")
+# Sunucunun her model çağrısına açıkça verdiği NMS ayarları. ultralytics YOLO
+# model.iou/max_det özniteliklerini okumaz; tüm altyapılar aynı ayarla çalışsın.
+NMS_SETTINGS = {"conf": 0.25, "iou": 0.45, "max_det": 50}
+
+
+class DetectionBoxes:
+    """Minimal stand-in for ``ultralytics`` ``Boxes``: ``data`` rows are x1, y1, x2, y2, conf, cls."""
+    __slots__ = ("data",)
+
+    def __init__(self, data):
+        self.data = data
+
+    def __len__(self):
+        return len(self.data)
+
+
+class DetectionResult:
+    """Per-image result with the ``boxes``/``names``/``speed`` fields used by ``main``."""
+    __slots__ = ("boxes", "names", "speed")
+
+    def __init__(self, data, names, speed):
+        self.boxes = DetectionBoxes(data)
+        self.names = names
+        self.speed = speed
+
+
+def letterbox(images, size, stride=32):
+    """Resize and pad images into one ``(n, 3, height, width)`` float32 RGB batch.
+
+    Like ultralytics, a batch of same-shape images is only padded up to a
+    multiple of ``stride`` (e.g. 640x480 stays 640x480); mixed shapes are
+    padded to ``size`` x ``size``. Returns the batch and, per image, the
+    ``(scale, pad_x, pad_y)`` needed to map boxes back.
+    """
+    shapes = {image.shape[:2] for image in images}
+    rect = len(shapes) == 1
+    plans = []
+    for image in images:
+        height, width = image.shape[:2]
+        scale = min(size / height, size / width)
+        new_width, new_height = round(width * scale), round(height * scale)
+        plans.append((scale, new_width, new_height))
+    if rect:
+        _, new_width, new_height = plans[0]
+        batch_width = -(-new_width // stride) * stride
+        batch_height = -(-new_height // stride) * stride
+    else:
+        batch_width = batch_height = size
+
+    batch = np.full((len(images), batch_height, batch_width, 3), 114, dtype=np.uint8)
+    transforms = []
+    for i, (image, (scale, new_width, new_height)) in enumerate(zip(images, plans)):
+        pad_x = round((batch_width - new_width) / 2 - 0.1)
+        pad_y = round((batch_height - new_height) / 2 - 0.1)
+        if (new_height, new_width) != image.shape[:2]:
+            image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+        batch[i, pad_y:pad_y + new_height, pad_x:pad_x + new_width] = image
+        transforms.append((scale, pad_x, pad_y))
+    # BGR -> RGB, NHWC -> NCHW, 0-1 aralığı
+    tensor = np.ascontiguousarray(batch[..., ::-1].transpose(0, 3, 1, 2), dtype=np.float32)
+    tensor *= 1 / 255.0
+    return tensor, transforms
+
+
+class ExportedModel:
+    """YOLO model exported to a CPU runtime, called like an ``ultralytics.YOLO``.
+
+    Subclasses only run the network (``_forward``); letterboxing, NMS and
+    mapping the boxes back to image coordinates happen here so every runtime
+    returns the same ``boxes``/``names`` results. ``conf``, ``iou`` and
+    ``max_det`` keyword arguments override the attributes for one call, as
+    with ``ultralytics.YOLO``.
+    """
+
+    def __init__(self, path, names, image_size=EXPORT_IMAGE_SIZE):
+        self.path = path
+        self.names = names
+        self.image_size = image_size
+        # ultralytics varsayılanları - ayar verilmeyen çağrılar torch ile aynı çalışır
+        self.conf = 0.25
+        self.iou = 0.7
+        self.max_det = 300
+
+    def _forward(self, batch):
+        raise NotImplementedError
+
+    def __call__(self, source, *args, conf=None, iou=None, max_det=None, **kwargs):
+        images = source if isinstance(source, list) else [source]
+        settings = (self.conf if conf is None else conf, self.iou if iou is None else iou,
+                    self.max_det if max_det is None else max_det)
+        start = time.perf_counter()
+        batch, transforms = letterbox(images, self.image_size)
+        preprocess_ms = (time.perf_counter() - start) * 1000 / len(images)
+
+        start = time.perf_counter()
+        output = self._forward(batch)
+        inference_ms = (time.perf_counter() - start) * 1000 / len(images)
+
+        results = []
+        for prediction, image, transform in zip(output, images, transforms):
+            start = time.perf_counter()
+            data = self._postprocess(prediction, image.shape, transform, *settings)
+            speed = {
+                "preprocess": preprocess_ms,
+                "inference": inference_ms,
+                "postprocess": (time.perf_counter() - start) * 1000,
+            }
+            results.append(DetectionResult(data, self.names, speed))
+        return results
+
+    def _postprocess(self, prediction, image_shape, transform, conf, iou, max_det):
+        """Turn one raw output into ``(n, 6)`` rows in original image coordinates."""
+        prediction = np.asarray(prediction, dtype=np.float32)
+        if prediction.shape[-1] == 6:
+            # Uçtan uca çıktı (YOLOv10): satırlar zaten x1, y1, x2, y2, güven, sınıf
+            data = prediction[prediction[:, 4] >= conf][:max_det]
+        else:
+            # (4 + sınıf sayısı, çapa) çıktısı: merkez/boyut kutuları, sınıf başına NMS
+            prediction = prediction.T
+            scores = prediction[:, 4:]
+            classes = scores.argmax(axis=1)
+            confidences = scores[np.arange(len(scores)), classes]
+            keep = confidences >= conf
+            xywh, confidences, classes = prediction[keep, :4], confidences[keep], classes[keep]
+            corners = np.concatenate([xywh[:, :2] - xywh[:, 2:] / 2, xywh[:, :2] + xywh[:, 2:] / 2], axis=1)
+            indices = cv2.dnn.NMSBoxesBatched(
+                np.concatenate([corners[:, :2], xywh[:, 2:]], axis=1).tolist(),
+                confidences.tolist(), classes.tolist(), conf, iou,
+            ) if len(corners) else []
+            indices = np.asarray(indices, dtype=np.intp).reshape(-1)[:max_det]
+            data = np.concatenate([corners[indices], confidences[indices, None],
+                                   classes[indices, None].astype(np.float32)], axis=1)
+
+        scale, pad_x, pad_y = transform
+        height, width = image_shape[:2]
+        data = data.copy()
+        data[:, [0, 2]] = ((data[:, [0, 2]] - pad_x) / scale).clip(0, width)
+        data[:, [1, 3]] = ((data[:, [1, 3]] - pad_y) / scale).clip(0, height)
+        return data
+
+
+class OnnxRuntimeModel(ExportedModel):
+    def __init__(self, path, names, threads=0, image_size=EXPORT_IMAGE_SIZE):
+        super().__init__(path, names, image_size)
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        # Kareler zaten havuzda paralel işleniyor; operatörler arası paralellik gereksiz
+        options.inter_op_num_threads = 1
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_name = self.session.get_inputs()[0].name
+        self.input_type = self.session.get_inputs()[0].type
+
+    def _forward(self, batch):
+        if self.input_type == "tensor(float16)":
+            batch = batch.astype(np.float16)
+        return self.session.run(None, {self.input_name: batch})[0]
+
+
+class OpenVinoModel(ExportedModel):
+    def __init__(self, path, names, threads=0, image_size=EXPORT_IMAGE_SIZE):
+        super().__init__(path, names, image_size)
+        import openvino
+
+        config = {"PERFORMANCE_HINT": "LATENCY"}
+        if threads:
+            config["INFERENCE_NUM_THREADS"] = threads
+        core = openvino.Core()
+        self.compiled = core.compile_model(core.read_model(path), "CPU", config)
+
+    def _forward(self, batch):
+        return self.compiled(batch)[0]
+
+
+class StubModel:
+    """Model stand-in for benchmarks: synthetic boxes, no weights needed.
+
+    ``boxes_per_class`` maps class names (keys of ``names``' values) to the
+    number of boxes emitted per image. Each box has a fixed place, size and
+    confidence relative to the image and moves by up to ``jitter`` pixels
+    per call, so tracking, caching and delta encoding see realistic input.
+    A call sleeps ``latency_ms`` per image to stand in for the network.
+    """
+
+    def __init__(self, names, boxes_per_class, latency_ms=0.0, jitter=2.0, seed=0):
+        self.names = dict(names)
+        class_ids = {name: idx for idx, name in self.names.items()}
+        unknown = set(boxes_per_class) - set(class_ids)
+        if unknown:
+            raise ValueError(f"Unknown stub classes: {sorted(unknown)}")
+        rng = np.random.default_rng(seed)
+        rows = []
+        for name, count in boxes_per_class.items():
+            for _ in range(count):
+                cx, cy = rng.uniform(0.1, 0.9, 2)
+                w, h = rng.uniform(0.04, 0.15), rng.uniform(0.08, 0.3)
+                rows.append((cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2, rng.uniform(0.3, 0.95), class_ids[name]))
+        # Görüntü boyutuna göre oranlar: x1, y1, x2, y2, güven, sınıf
+        self.layout = np.array(rows, dtype=np.float64).reshape(-1, 6)
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.rng = np.random.default_rng(seed + 1)
+        self.conf = 0.25
+        self.iou = 0.7
+        self.max_det = 300
+
+    def _detect(self, image, conf, max_det):
+        height, width = image.shape[:2]
+        data = self.layout.copy()
+        data[:, [0, 2]] *= width
+        data[:, [1, 3]] *= height
+        data[:, :4] += self.rng.uniform(-self.jitter, self.jitter, (len(data), 1))
+        data[:, [0, 2]] = data[:, [0, 2]].clip(0, width)
+        data[:, [1, 3]] = data[:, [1, 3]].clip(0, height)
+        return data[data[:, 4] >= conf][:max_det]
+
+    def __call__(self, source, verbose=False, conf=None, max_det=None, **kwargs):
+        images = source if isinstance(source, list) else [source]
+        conf = self.conf if conf is None else conf
+        max_det = self.max_det if max_det is None else max_det
+        start = time.perf_counter()
+        if self.latency_ms:
+            time.sleep(self.latency_ms * len(images) / 1000)
+        results = [self._detect(image, conf, max_det) for image in images]
+        per_image_ms = (time.perf_counter() - start) * 1000 / len(images)
+        speed = {"preprocess": 0.0, "inference": per_image_ms, "postprocess": 0.0}
+        return [DetectionResult(data, self.names, speed) for data in results]
+
+
+def artifact_path(model_path, backend, precision):
+    """Where the exported model of ``backend``/``precision`` is cached, next to the weights."""
+    stem = os.path.splitext(model_path)[0]
+    if backend == "onnx":
+        return f"{stem}.{precision}.onnx"
+    if backend == "openvino":
+        return os.path.join(f"{stem}_{precision}_openvino_model", "model.xml")
+    raise ValueError(f"Bilinmeyen çıkarım altyapısı: {backend}")
+
+
+def _metadata_path(artifact):
+    return artifact + ".json"
+
+
+def _is_fresh(artifact, model_path):
+    return (os.path.exists(artifact) and os.path.exists(_metadata_path(artifact))
+            and os.path.getmtime(artifact) >= os.path.getmtime(model_path))
+
+
+def load_calibration_images(directory, limit=300):
+    """Read up to ``limit`` images from ``directory`` for INT8 calibration."""
+    images = []
+    for name in sorted(os.listdir(directory)):
+        if name.lower().endswith((".jpg", ".jpeg", ".png", ".bmp", ".webp")):
+            image = cv2.imread(os.path.join(directory, name))
+            if image is not None:
+                images.append(image)
+        if len(images) >= limit:
+            break
+    return images
+
+
+def export_model(model_path, backend, precision, yolo_class, calibration_dir=None):
+    """Export ``model_path`` with ultralytics and convert it to ``precision``.
+
+    FP16 keeps float32 inputs/outputs. ONNX INT8 uses ONNX Runtime dynamic
+    quantization and needs no data; OpenVINO INT8 is NNCF post-training
+    quantization calibrated on the images in ``calibration_dir`` (a few
+    hundred site photos are enough).
+    """
+    artifact = artifact_path(model_path, backend, precision)
+    yolo = yolo_class(model_path)
+    names = {int(k): v for k, v in yolo.names.items()}
+    print(f"Model dışa aktarılıyor: {backend} ({precision}) -> {artifact}")
+
+    if backend == "onnx":
+        exported = yolo.export(format="onnx", imgsz=EXPORT_IMAGE_SIZE, dynamic=True, simplify=True)
+        if precision == "fp32":
+            shutil.move(exported, artifact)
+        elif precision == "fp16":
+            import onnx
+            from onnxruntime.transformers.float16 import convert_float_to_float16
+
+            converted = convert_float_to_float16(onnx.load(exported), keep_io_types=True)
+            onnx.save(converted, artifact)
+            os.remove(exported)
+        else:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            quantize_dynamic(exported, artifact, weight_type=QuantType.QUInt8)
+            os.remove(exported)
+    else:
+        exported = yolo.export(format="openvino", imgsz=EXPORT_IMAGE_SIZE, dynamic=True,
+                               half=precision == "fp16")
+        directory = os.path.dirname(artifact)
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+        import openvino
+
+        xml = next(os.path.join(exported, f) for f in os.listdir(exported) if f.endswith(".xml"))
+        ov_model = openvino.Core().read_model(xml)
+        if precision == "int8":
+            import nncf
+
+            images = load_calibration_images(calibration_dir) if calibration_dir else []
+            if not images:
+                raise ValueError("OpenVINO INT8 için kalibrasyon görüntüleri gerekli (INFERENCE_CALIBRATION_DIR)")
+            dataset = nncf.Dataset(images, lambda image: letterbox([image], EXPORT_IMAGE_SIZE)[0])
+            ov_model = nncf.quantize(ov_model, dataset, preset=nncf.QuantizationPreset.MIXED,
+                                     subset_size=len(images))
+        openvino.save_model(ov_model, artifact, compress_to_fp16=precision == "fp16")
+        shutil.rmtree(exported, ignore_errors=True)
+
+    # Sınıf adları yan dosyada: çalışma anında torch/ultralytics gerekmez
+    with open(_metadata_path(artifact), "w", encoding="utf-8") as f:
+        json.dump({"names": names, "image_size": EXPORT_IMAGE_SIZE, "precision": precision}, f)
+    return artifact
+
+
+def load_exported_model(model_path, backend, precision="fp32", threads=0, import_yolo=None,
+                        calibration_dir=None):
+    """Load the cached export of ``model_path``, exporting it first if needed.
+
+    The export is redone when the weights are newer than the artifact.
+    ``import_yolo`` returns the ultralytics ``YOLO`` class; it is only
+    called when an export is needed, so a cached artifact starts without
+    importing torch.
+    """
+    if precision not in PRECISIONS:
+        raise ValueError(f"Bilinmeyen hassasiyet: {precision} (seçenekler: {', '.join(PRECISIONS)})")
+    artifact = artifact_path(model_path, backend, precision)
+    if not _is_fresh(artifact, model_path):
+        yolo_class = import_yolo() if import_yolo is not None else None
+        if not hasattr(yolo_class, "export"):
+            raise RuntimeError(f"Dışa aktarılmış model yok ve ultralytics bulunamadı: {artifact}")
+        export_model(model_path, backend, precision, yolo_class, calibration_dir)
+
+    with open(_metadata_path(artifact), encoding="utf-8") as f:
+        metadata = json.load(f)
+    names = {int(k): v for k, v in metadata["names"].items()}
+    model_class = OnnxRuntimeModel if backend == "onnx" else OpenVinoModel
+    return model_class(artifact, names, threads=threads, image_size=metadata["image_size"])
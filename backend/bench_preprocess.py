@@ -0,0 +1,104 @@
+"""Micro-benchmark of the upload preprocessing: reference vs ``VariantPreprocessor``.
+
+Reports time per frame and the memory allocated per frame (tracemalloc
+peak above the steady state, and arrays left behind), and checks that
+both produce identical variants.
+
+    python bench_preprocess.py --frames 200 --size 640x480
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+import numpy as np
+
+from preprocess import VariantPreprocessor, build_variants_reference
+
+
+def make_frames(count, width, height):
+    rng = np.random.default_rng(0)
+    frames = []
+    for _ in range(count):
+        frame = rng.integers(0, 255, (height, width, 3), dtype=np.uint8)
+        # Maskenin boş kalmaması için kırmızı bir bölge
+        frame[: height // 4, : width // 4] = (20, 20, 230)
+        frames.append(frame)
+    return frames
+
+
+def run_reference(frame):
+    variants, _ = build_variants_reference(frame)
+    return variants
+
+
+def make_engine_runner():
+    engine = VariantPreprocessor()
+
+    def run(frame):
+        variants, _, buffers = engine.build(frame)
+        # Gerçek akışta çıkarım bitince geri verilir
+        engine.release(buffers)
+        return variants
+
+    return run, engine
+
+
+def measure(run, frames, repeats):
+    for frame in frames[:5]:  # ısıtma
+        run(frame)
+    timings = []
+    for _ in range(repeats):
+        for frame in frames:
+            start = time.perf_counter()
+            run(frame)
+            timings.append((time.perf_counter() - start) * 1000)
+
+    gc.collect()
+    tracemalloc.start()
+    peaks = []
+    for frame in frames:
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        variants = run(frame)
+        _, peak = tracemalloc.get_traced_memory()
+        peaks.append(peak - before)
+        del variants
+    tracemalloc.stop()
+
+    values = np.array(timings)
+    return {
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "alloc_kib_per_frame": float(np.mean(peaks)) / 1024,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=4)
+    parser.add_argument("--size", default="640x480", help="WIDTHxHEIGHT")
+    args = parser.parse_args()
+
+    width, height = (int(v) for v in args.size.lower().split("x"))
+    frames = make_frames(args.frames, width, height)
+    engine_run, engine = make_engine_runner()
+
+    for frame in frames[:5]:
+        for (name, expected), (_, actual) in zip(run_reference(frame), engine_run(frame)):
+            if not np.array_equal(expected, actual):
+                raise SystemExit(f"Varyant farklı: {name}")
+
+    results = {"reference": measure(run_reference, frames, args.repeats),
+               "engine": measure(engine_run, frames, args.repeats)}
+    print(f"{'':<10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'alloc KiB/frame':>17}")
+    for name, result in results.items():
+        print(f"{name:<10}{result['mean_ms']:>10.2f}{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}"
+              f"{result['alloc_kib_per_frame']:>17.1f}")
+    print(f"buffer sets: {engine.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,631 @@
+"""Offline benchmark of the detection pipeline, no browser or model needed.
+
+``replay`` sends the frames of an image directory/glob or a video file
+through ``/ws`` of an in-process app (``fastapi.testclient``, needs
+``httpx``), so every frame takes the ``websocket_endpoint`` path. It
+reports throughput, p50/p95/p99 per stage (raw samples taken from
+``main.metrics``) and memory growth over the run: process RSS, Python
+heap and the allocation sites that grew the most (tracker history, result
+cache, buffer pools...).
+
+``load`` starts a local uvicorn (or targets ``--url``) and drives it with
+several WebSocket clients at once. It reports the round-trip percentiles
+and throughput seen by the clients, the server stage percentiles estimated
+from the ``/metrics`` histograms and the server RSS.
+
+``compare`` prints the p50/p95 and throughput changes between two reports.
+
+The model is ``INFERENCE_BACKEND=stub`` unless the environment says
+otherwise; ``--stub-boxes`` and ``--stub-latency-ms`` set its output.
+The result cache and the webcam motion gate are turned off so every frame
+reaches the model (``--result-cache`` / ``--motion-gate`` keep them on).
+Without a source, synthetic frames with moving blocks are used.
+
+    python benchmark.py replay images/ --frames 1000 --json before.json
+    python benchmark.py replay site.mp4 --mode webcam --memory
+    python benchmark.py load --clients 8 --frames 200 --json load.json
+    python benchmark.py compare before.json after.json
+"""
+import argparse
+import asyncio
+import base64
+import datetime
+import gc
+import glob
+import json
+import os
+import platform
+import re
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+import urllib.request
+from collections import defaultdict
+
+import cv2
+import numpy as np
+
+from protocol import FRAME_HEADER, MODE_UPLOAD, MODE_WEBCAM, PROTOCOL_VERSION, QUALITY_CODES
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".webp")
+# Rapora eklenen sunucu ayarları
+CONFIG_PREFIXES = ("INFERENCE_", "STUB_", "MICRO_BATCHING", "MAX_BATCH", "BATCH_", "RESULT_CACHE",
+                   "MOTION_GATE", "UPLOAD_QUALITY", "BALANCED_VARIANTS", "FIRE_MASK", "TILE", "TILED_",
+                   "FRAME_QUEUE", "TRACK", "MAX_IMAGE")
+PERCENTILES = (50, 95, 99)
+LABEL_PATTERN = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def load_frames(source, count, size):
+    """Up to ``count`` frames from a video file, an image directory/glob, or synthetic ones."""
+    frames = []
+    if source and os.path.isfile(source) and not source.lower().endswith(IMAGE_EXTENSIONS):
+        capture = cv2.VideoCapture(source)
+        while len(frames) < count:
+            ok, frame = capture.read()
+            if not ok:
+                break
+            frames.append(frame)
+        capture.release()
+    elif source:
+        pattern = os.path.join(source, "*") if os.path.isdir(source) else source
+        paths = sorted(p for p in glob.glob(pattern) if p.lower().endswith(IMAGE_EXTENSIONS))
+        for path in paths[:count]:
+            frame = cv2.imread(path)
+            if frame is not None:
+                frames.append(frame)
+    if not frames:
+        if source:
+            raise SystemExit(f"No frames could be read from {source}")
+        frames = synthetic_frames(min(count, 60), size)
+    return frames
+
+
+def synthetic_frames(count, size):
+    """Camera-like frames: a textured gradient with a few blocks moving across it.
+
+    Pure noise would look static to the motion gate once blurred and
+    downscaled; these frames change every frame like a busy site camera.
+    """
+    width, height = size
+    rng = np.random.default_rng(0)
+    gradient = np.linspace(40, 200, width, dtype=np.float32)[None, :, None]
+    background = np.clip(gradient + rng.normal(0, 12, (height, width, 3)), 0, 255).astype(np.uint8)
+    blocks = [(rng.uniform(0, width), rng.uniform(0, height), rng.uniform(-12, 12), rng.uniform(-8, 8),
+               rng.integers(0, 255, 3).tolist()) for _ in range(6)]
+    block_width, block_height = width // 12, height // 6
+    frames = []
+    for index in range(count):
+        frame = background.copy()
+        for x, y, dx, dy, colour in blocks:
+            x1 = int(x + dx * index) % (width - block_width)
+            y1 = int(y + dy * index) % (height - block_height)
+            cv2.rectangle(frame, (x1, y1), (x1 + block_width, y1 + block_height), colour, -1)
+        frames.append(frame)
+    return frames
+
+
+def encode_frames(frames, quality):
+    """JPEG bytes of each frame; encoded once so the client side costs nothing during the run."""
+    encoded = []
+    for frame in frames:
+        ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+        if not ok:
+            raise SystemExit("JPEG encoding failed")
+        encoded.append(buffer.tobytes())
+    return encoded
+
+
+def frame_message(jpeg, index, webcam, transport, quality):
+    """A ``/ws`` frame message as the frontend sends it: binary header + JPEG, or ``detect`` JSON."""
+    timestamp = int(time.time() * 1000)
+    if transport == "binary":
+        mode = MODE_WEBCAM if webcam else MODE_UPLOAD
+        # Kalite yoksa (None) kod 0 - sunucu varsayılanı
+        quality_code = QUALITY_CODES.index(quality)
+        return FRAME_HEADER.pack(PROTOCOL_VERSION, mode, quality_code, index, timestamp) + jpeg
+    message = {
+        "type": "detect",
+        "image": "data:image/jpeg;base64," + base64.b64encode(jpeg).decode("ascii"),
+        "mode": "webcam" if webcam else "upload",
+        "frame_id": index,
+        "timestamp": timestamp,
+    }
+    if quality:
+        message["quality"] = quality
+    return json.dumps(message)
+
+
+def encoding_message(encoding):
+    """``encoding`` control message for ``--encoding``, or ``None`` for plain JSON results."""
+    if encoding == "plain":
+        return None
+    return json.dumps({"type": "encoding", "compact": True, "delta": encoding == "delta", "format": "json"})
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = np.asarray(values, dtype=np.float64)
+    summary = {f"p{p}_ms": float(np.percentile(values, p)) for p in PERCENTILES}
+    summary["mean_ms"] = float(values.mean())
+    summary["count"] = int(len(values))
+    return summary
+
+
+def rss_bytes(pid="self"):
+    """Current resident set size from ``/proc``; peak RSS of this process elsewhere."""
+    try:
+        with open(f"/proc/{pid}/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        if pid != "self":
+            return None
+        # Linux dışında yalnızca tepe değer var (macOS bayt, Linux KB verir)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+def growth_per_1000(samples, key):
+    """Least-squares slope of ``key`` over frame count, in bytes per 1000 frames."""
+    points = [(s["frames"], s[key]) for s in samples if s.get(key) is not None]
+    if len(points) < 2:
+        return None
+    frames, values = np.array(points, dtype=np.float64).T
+    if np.ptp(frames) == 0:
+        return None
+    return float(np.polyfit(frames, values, 1)[0] * 1000)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def metadata(args):
+    return {
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "argv": sys.argv[1:],
+        "config": {k: v for k, v in sorted(os.environ.items()) if k.startswith(CONFIG_PREFIXES)},
+        "args": {k: v for k, v in vars(args).items() if k != "func"},
+    }
+
+
+def configure_stub(args):
+    """Select the stub model unless a backend was chosen; must run before ``main`` is imported."""
+    os.environ.setdefault("INFERENCE_BACKEND", "stub")
+    if args.stub_boxes:
+        os.environ["STUB_BOXES"] = args.stub_boxes
+    if args.stub_latency_ms is not None:
+        os.environ["STUB_LATENCY_MS"] = str(args.stub_latency_ms)
+    if not args.result_cache:
+        # Kareler döngüyle tekrarlandığından önbellek açıkken çıkarım ölçülmez
+        os.environ["RESULT_CACHE"] = "0"
+    if not args.motion_gate:
+        # Hareket kapısı açıkken webcam karelerinin çoğu modele hiç ulaşmayabilir
+        os.environ["MOTION_GATE"] = "0"
+
+
+def wait_until_ready(get, timeout):
+    """Poll ``/`` until the model is loaded and warmed up (200), as ``load`` does for uvicorn."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        response = get()
+        if response.status_code == 200:
+            return response.json()
+        startup = response.json().get("startup", {})
+        if startup.get("phase") == "failed":
+            raise SystemExit(f"Model warmup failed: {startup.get('error')}")
+        time.sleep(0.1)
+    raise SystemExit("The server did not become ready in time")
+
+
+def replay(args):
+    configure_stub(args)
+    try:
+        from fastapi.testclient import TestClient
+    except RuntimeError as e:  # starlette httpx olmadan TestClient'ı yüklemez
+        raise SystemExit(f"replay needs httpx: {e}")
+    import main
+
+    frames = load_frames(args.source, args.frames, args.size)
+    encoded = encode_frames(frames, args.jpeg_quality)
+    webcam = args.mode == "webcam"
+
+    samples = defaultdict(list)
+
+    def on_observe(connection_id, stage, seconds, variant):
+        # Varyant bazlı süreler toplamdan ayrı tutulur
+        samples[f"{stage}[{variant}]" if variant else stage].append(seconds * 1000)
+
+    report = {"mode": args.mode, "unique_frames": len(frames), "frame_shape": list(frames[0].shape)}
+    with TestClient(main.app) as client:
+        # Açılıştaki model ısıtması (arka plan iş parçacığı) ölçülen karelerle çakışmasın
+        report["startup"] = wait_until_ready(lambda: client.get("/"), args.startup_timeout)["startup"]
+        with client.websocket_connect("/ws") as ws:
+            control = encoding_message(args.encoding)
+            if control is not None:
+                ws.send_text(control)
+                ws.receive_json()
+
+            def run(index):
+                """Send one frame, wait for its result; returns round-trip ms and result bytes."""
+                message = frame_message(encoded[index % len(encoded)], index, webcam, args.transport, args.quality)
+                start = time.perf_counter()
+                if isinstance(message, bytes):
+                    ws.send_bytes(message)
+                else:
+                    ws.send_text(message)
+                reply = ws.receive()
+                elapsed = (time.perf_counter() - start) * 1000
+                payload = reply.get("text") if reply.get("text") is not None else reply.get("bytes")
+                if args.encoding == "delta" and isinstance(payload, str):
+                    seq = json.loads(payload).get("seq")
+                    if seq is not None:
+                        ws.send_text(json.dumps({"type": "ack", "seq": seq}))
+                return elapsed, len(payload or b"")
+
+            # Isıtma: model yükleme ve ilk çağrılar ölçüme girmez
+            warmup_start = time.perf_counter()
+            for index in range(args.warmup):
+                run(index)
+            report["warmup_s"] = time.perf_counter() - warmup_start
+            main.metrics.listeners.append(on_observe)
+
+            memory = []
+            if args.memory:
+                gc.collect()
+                tracemalloc.start(10)
+                baseline = tracemalloc.take_snapshot()
+
+            def sample_memory(done):
+                entry = {"frames": done, "rss_bytes": rss_bytes()}
+                if args.memory:
+                    entry["heap_bytes"] = tracemalloc.get_traced_memory()[0]
+                memory.append(entry)
+
+            round_trips = []
+            message_bytes = []
+            sample_memory(0)
+            start = time.perf_counter()
+            for done in range(1, args.frames + 1):
+                elapsed, size = run(args.warmup + done - 1)
+                round_trips.append(elapsed)
+                message_bytes.append(size)
+                if done % args.sample_every == 0 or done == args.frames:
+                    sample_memory(done)
+            wall = time.perf_counter() - start
+            main.metrics.listeners.remove(on_observe)
+
+            if args.memory:
+                gc.collect()
+                # Ölçüm aracının kendi listeleri ve son gönderilen mesaj sayılmaz
+                ignore = [tracemalloc.Filter(False, __file__), tracemalloc.Filter(False, tracemalloc.__file__)]
+                snapshot = tracemalloc.take_snapshot().filter_traces(ignore)
+                baseline = baseline.filter_traces(ignore)
+                tracemalloc.stop()
+                report["top_growth"] = [
+                    {"site": str(stat.traceback[0]), "size_diff_bytes": stat.size_diff, "count_diff": stat.count_diff}
+                    for stat in snapshot.compare_to(baseline, "lineno")[:args.top]
+                    if stat.size_diff > 0
+                ]
+        report["server_stats"] = client.get("/stats").json()
+
+    report["frames"] = args.frames
+    report["wall_s"] = wall
+    report["throughput_fps"] = args.frames / wall if wall else None
+    report["round_trip"] = percentiles(round_trips)
+    report["result_bytes_mean"] = float(np.mean(message_bytes)) if message_bytes else None
+    report["stages"] = {stage: percentiles(values) for stage, values in sorted(samples.items())}
+    report["memory"] = {
+        "samples": memory,
+        "rss_growth_per_1000_frames": growth_per_1000(memory, "rss_bytes"),
+        "heap_growth_per_1000_frames": growth_per_1000(memory, "heap_bytes") if args.memory else None,
+    }
+    return report
+
+
+def parse_histograms(text):
+    """``{stage: [(upper_bound, cumulative_count), ...]}`` of the global ``/metrics`` histograms."""
+    buckets = defaultdict(list)
+    for line in text.splitlines():
+        # Bağlantı bazlı seriler (connection_frame_stage_seconds) bu önekle başlamaz
+        if not line.startswith("frame_stage_seconds_bucket{"):
+            continue
+        labels, value = line[len("frame_stage_seconds_bucket{"):].rsplit("} ", 1)
+        fields = dict(LABEL_PATTERN.findall(labels))
+        stage = fields["stage"] + (f"[{fields['variant']}]" if fields.get("variant") else "")
+        bound = float("inf") if fields["le"] == "+Inf" else float(fields["le"])
+        buckets[stage].append((bound, float(value)))
+    return {stage: sorted(rows) for stage, rows in buckets.items()}
+
+
+def histogram_quantile(q, rows):
+    """Quantile estimate with linear interpolation inside the bucket, like PromQL's ``histogram_quantile``."""
+    total = rows[-1][1] if rows else 0
+    if not total:
+        return None
+    rank = q * total
+    previous_bound, previous_count = 0.0, 0.0
+    for bound, count in rows:
+        if count >= rank:
+            if bound == float("inf"):
+                return previous_bound
+            fraction = (rank - previous_count) / (count - previous_count) if count > previous_count else 0.0
+            return previous_bound + (bound - previous_bound) * fraction
+        previous_bound, previous_count = bound, count
+    return previous_bound
+
+
+def histogram_summary(before, after):
+    """Server stage quantiles (ms) of the observations made between two ``/metrics`` scrapes."""
+    summary = {}
+    for stage, rows in after.items():
+        earlier = dict(before.get(stage, []))
+        rows = [(bound, count - earlier.get(bound, 0.0)) for bound, count in rows]
+        if not rows or not rows[-1][1]:
+            continue
+        entry = {f"p{p}_ms": histogram_quantile(p / 100, rows) * 1000 for p in PERCENTILES}
+        entry["count"] = int(rows[-1][1])
+        summary[stage] = entry
+    return summary
+
+
+def http_get(url, timeout=5):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return response.read().decode()
+
+
+def start_server(args):
+    """Local uvicorn with the stub model; returns the process once ``/`` reports ready."""
+    env = dict(os.environ)
+    # Yük testi uzun sürer - sunucu logları rapora karışmasın diye dosyaya yazılır
+    log = open(args.server_log, "w") if args.server_log else subprocess.DEVNULL
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(args.port),
+         "--log-level", "warning"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+    deadline = time.monotonic() + args.startup_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"uvicorn exited with code {process.returncode}")
+        try:
+            http_get(f"http://127.0.0.1:{args.port}/")
+            return process
+        except OSError:  # 503 (ısınıyor) da HTTPError olarak buraya düşer
+            time.sleep(0.2)
+    process.terminate()
+    raise SystemExit("uvicorn did not become ready in time")
+
+
+async def run_client(url, encoded, args, client_index, results):
+    import websockets
+
+    webcam = args.mode == "webcam"
+    round_trips = []
+    received_bytes = 0
+    errors = 0
+    interval = 1 / args.fps if args.fps else 0
+    async with websockets.connect(url, max_size=None) as ws:
+        control = encoding_message(args.encoding)
+        if control is not None:
+            await ws.send(control)
+            await ws.recv()
+        next_send = time.perf_counter()
+        for index in range(args.frames):
+            if interval:
+                # Sabit hızlı kamera gibi: bir sonraki karenin zamanı beklenir
+                await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+                next_send += interval
+            message = frame_message(encoded[(index + client_index) % len(encoded)], index, webcam,
+                                    args.transport, args.quality)
+            start = time.perf_counter()
+            await ws.send(message)
+            reply = await ws.recv()
+            round_trips.append((time.perf_counter() - start) * 1000)
+            received_bytes += len(reply)
+            if isinstance(reply, str):
+                data = json.loads(reply)
+                errors += data.get("status") == "error"
+                if args.encoding == "delta" and data.get("seq") is not None:
+                    await ws.send(json.dumps({"type": "ack", "seq": data["seq"]}))
+    results[client_index] = {"round_trips": round_trips, "bytes": received_bytes, "errors": errors}
+
+
+async def drive_clients(url, encoded, args, on_tick):
+    results = {}
+    clients = [asyncio.create_task(run_client(url, encoded, args, i, results)) for i in range(args.clients)]
+    pending = set(clients)
+    while pending:
+        _, pending = await asyncio.wait(pending, timeout=args.sample_interval)
+        on_tick()
+    for task in clients:
+        task.result()  # istemci hatalarını yüzeye çıkar
+    return results
+
+
+def load(args):
+    configure_stub(args)
+    frames = load_frames(args.source, max(args.frames, 1), args.size)
+    encoded = encode_frames(frames, args.jpeg_quality)
+
+    process = None
+    if args.url:
+        url = args.url
+    else:
+        process = start_server(args)
+        url = f"ws://127.0.0.1:{args.port}/ws"
+    http_base = url.replace("ws://", "http://", 1).replace("wss://", "https://", 1).rsplit("/ws", 1)[0]
+
+    try:
+        # Isıtma: tek istemci, birkaç kare - model ilk çağrılarını ölçüm dışında yapar
+        warmup_args = argparse.Namespace(**dict(vars(args), clients=1, frames=args.warmup, fps=0))
+        if args.warmup:
+            asyncio.run(drive_clients(url, encoded, warmup_args, lambda: None))
+
+        before = parse_histograms(http_get(http_base + "/metrics"))
+        memory = []
+        start = time.perf_counter()
+
+        def on_tick():
+            if process is not None:
+                memory.append({"elapsed_s": time.perf_counter() - start, "rss_bytes": rss_bytes(process.pid)})
+
+        on_tick()
+        results = asyncio.run(drive_clients(url, encoded, args, on_tick))
+        wall = time.perf_counter() - start
+        on_tick()
+        after = parse_histograms(http_get(http_base + "/metrics"))
+        server_stats = json.loads(http_get(http_base + "/stats"))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+
+    round_trips = [ms for result in results.values() for ms in result["round_trips"]]
+    frames = len(round_trips)
+    rss = [m["rss_bytes"] for m in memory if m["rss_bytes"] is not None]
+    return {
+        "mode": args.mode,
+        "clients": args.clients,
+        "frames": frames,
+        "wall_s": wall,
+        "throughput_fps": frames / wall if wall else None,
+        "errors": sum(result["errors"] for result in results.values()),
+        "result_bytes_mean": sum(r["bytes"] for r in results.values()) / frames if frames else None,
+        "round_trip": percentiles(round_trips),
+        "per_client_fps": [len(r["round_trips"]) / wall for _, r in sorted(results.items())] if wall else [],
+        "stages": histogram_summary(before, after),
+        "stages_source": "prometheus histogram buckets (interpolated)",
+        "memory": {
+            "samples": memory,
+            "rss_start_bytes": rss[0] if rss else None,
+            "rss_end_bytes": rss[-1] if rss else None,
+        },
+        "server_stats": server_stats,
+    }
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        old = json.load(f)["results"]
+    with open(args.candidate) as f:
+        new = json.load(f)["results"]
+
+    def change(a, b):
+        return (b - a) / a * 100 if a else None
+
+    rows = {"throughput_fps": (old.get("throughput_fps"), new.get("throughput_fps"))}
+    for name, stats in [("round_trip", None)] + sorted(old.get("stages", {}).items()):
+        before = old.get(name) if stats is None else stats
+        after = new.get(name) if stats is None else new.get("stages", {}).get(name)
+        if not before or not after:
+            continue
+        for key in ("p50_ms", "p95_ms"):
+            rows[f"{name} {key}"] = (before.get(key), after.get(key))
+    report = {}
+    for name, (a, b) in rows.items():
+        if a is None or b is None:
+            continue
+        report[name] = {"baseline": a, "candidate": b, "change_pct": change(a, b)}
+    return report
+
+
+def print_report(results):
+    if "stages" not in results:  # compare çıktısı
+        for name, row in results.items():
+            pct = f"{row['change_pct']:+.1f}%" if row["change_pct"] is not None else "n/a"
+            print(f"{name:45s} {row['baseline']:10.2f} -> {row['candidate']:10.2f}  {pct}")
+        return
+    print(f"frames: {results['frames']}  wall: {results['wall_s']:.2f} s  "
+          f"throughput: {results['throughput_fps']:.1f} fps")
+    if results.get("round_trip"):
+        rt = results["round_trip"]
+        print(f"round trip (ms): p50 {rt['p50_ms']:.2f}  p95 {rt['p95_ms']:.2f}  p99 {rt['p99_ms']:.2f}")
+    print(f"{'stage':40s} {'count':>7s} {'p50 ms':>9s} {'p95 ms':>9s} {'p99 ms':>9s}")
+    for stage, stats in results["stages"].items():
+        if stats:
+            print(f"{stage:40s} {stats['count']:7d} {stats['p50_ms']:9.2f} {stats['p95_ms']:9.2f} {stats['p99_ms']:9.2f}")
+    memory = results.get("memory", {})
+    for key in ("rss_growth_per_1000_frames", "heap_growth_per_1000_frames"):
+        if memory.get(key) is not None:
+            print(f"{key}: {memory[key] / 1024:.1f} KiB")
+    if memory.get("rss_end_bytes") is not None:
+        print(f"server rss: {memory['rss_start_bytes'] / 2**20:.1f} -> {memory['rss_end_bytes'] / 2**20:.1f} MiB")
+    for entry in results.get("top_growth", []):
+        print(f"  +{entry['size_diff_bytes'] / 1024:8.1f} KiB  {entry['count_diff']:+6d}  {entry['site']}")
+
+
+def add_common(parser):
+    parser.add_argument("--frames", type=int, default=300, help="measured frames (per client for load)")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--mode", choices=("upload", "webcam"), default="upload")
+    parser.add_argument("--quality", choices=("fast", "balanced", "full"), help="upload quality mode")
+    parser.add_argument("--transport", choices=("binary", "json"), default="binary")
+    parser.add_argument("--encoding", choices=("plain", "compact", "delta"), default="plain",
+                        help="result encoding requested with an 'encoding' message")
+    parser.add_argument("--size", default="1280x720", help="synthetic frame size when no source is given")
+    parser.add_argument("--jpeg-quality", type=int, default=85)
+    parser.add_argument("--stub-boxes", help='stub boxes per class, e.g. "insan=5,cukur=2"')
+    parser.add_argument("--stub-latency-ms", type=float, help="stub inference time per image")
+    parser.add_argument("--result-cache", action="store_true",
+                        help="keep the server result cache on (repeated frames then skip inference)")
+    parser.add_argument("--motion-gate", action="store_true",
+                        help="keep the webcam motion gate on (static frames then skip inference)")
+    parser.add_argument("--startup-timeout", type=float, default=120, help="seconds to wait for model warmup")
+    parser.add_argument("--json", help="write the report to this file")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    replay_parser = commands.add_parser("replay", help="replay frames through an in-process /ws")
+    replay_parser.add_argument("source", nargs="?", help="image directory, glob or video file")
+    add_common(replay_parser)
+    replay_parser.add_argument("--memory", action="store_true",
+                               help="trace Python allocations (slower) and list the sites that grew")
+    replay_parser.add_argument("--sample-every", type=int, default=50, help="memory sample interval in frames")
+    replay_parser.add_argument("--top", type=int, default=10, help="allocation sites to list with --memory")
+    replay_parser.set_defaults(func=replay)
+
+    load_parser = commands.add_parser("load", help="several WebSocket clients against uvicorn")
+    load_parser.add_argument("source", nargs="?", help="image directory, glob or video file")
+    add_common(load_parser)
+    load_parser.add_argument("--clients", type=int, default=4)
+    load_parser.add_argument("--fps", type=float, default=0, help="send rate per client (0 = closed loop)")
+    load_parser.add_argument("--url", help="existing server, e.g. ws://host:8000/ws (default: start uvicorn)")
+    load_parser.add_argument("--port", type=int, default=8765)
+    load_parser.add_argument("--sample-interval", type=float, default=1.0, help="server RSS sample interval (s)")
+    load_parser.add_argument("--server-log", help="write the uvicorn output to this file")
+    load_parser.set_defaults(func=load)
+
+    compare_parser = commands.add_parser("compare", help="changes between two JSON reports")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("candidate")
+    compare_parser.add_argument("--json", help="write the comparison to this file")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    if hasattr(args, "size"):
+        args.size = tuple(int(v) for v in args.size.lower().split("x"))
+    results = args.func(args)
+    print_report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"meta": metadata(args), "results": results}, f, indent=2, default=str)
+        print(f"Rapor yazıldı: {args.json}")
+
+
+if __name__ == "__main__":
+    main()
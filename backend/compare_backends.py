@@ -0,0 +1,160 @@
+"""Compare the latency and accuracy of inference backends against torch.
+
+Every backend runs on the same images; the torch (ultralytics) detections
+are the reference. A detection counts as reproduced when a box of the same
+class overlaps it with IoU >= 0.5.
+
+    python compare_backends.py images/*.jpg --backends onnx:fp32 onnx:int8 openvino:fp16
+"""
+import argparse
+import glob
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+from backends import NMS_SETTINGS, load_exported_model
+from postprocess import pairwise_iou
+
+MODEL_PATH = os.path.join(os.path.dirname(__file__), "models", "best.pt")
+
+
+def load_images(patterns, count):
+    paths = sorted(p for pattern in patterns for p in glob.glob(pattern))
+    images = [cv2.imread(p) for p in paths]
+    images = [image for image in images if image is not None]
+    if not images:
+        # Görüntü verilmezse rastgele kareler - yalnızca gecikme için anlamlı
+        rng = np.random.default_rng(0)
+        images = [rng.integers(0, 255, (480, 640, 3), dtype=np.uint8) for _ in range(count)]
+    return images
+
+
+def match(reference, candidate, iou_threshold=0.5):
+    """Greedy same-class matching; returns matched count and their IoUs."""
+    if len(reference) == 0 or len(candidate) == 0:
+        return 0, []
+    iou = pairwise_iou(reference[:, :4].astype(np.float64), candidate[:, :4].astype(np.float64))
+    iou[reference[:, 5][:, None] != candidate[:, 5][None, :]] = 0.0
+    matched = []
+    used = set()
+    for row in np.argsort(-reference[:, 4]).tolist():
+        cols = [c for c in np.argsort(-iou[row]).tolist() if c not in used and iou[row, c] >= iou_threshold]
+        if cols:
+            used.add(cols[0])
+            matched.append(float(iou[row, cols[0]]))
+    return len(matched), matched
+
+
+def time_backend(run, images, batch_size, repeats):
+    """Per-call latencies (ms) of ``run`` on batches of ``batch_size`` images."""
+    batches = [images[i:i + batch_size] for i in range(0, len(images), batch_size)]
+    run(batches[0])  # ısıtma
+    latencies = []
+    for _ in range(repeats):
+        for batch in batches:
+            start = time.perf_counter()
+            run(batch)
+            latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def summarize(latencies, batch_size):
+    values = np.array(latencies)
+    return {
+        "batch_size": batch_size,
+        "mean_ms": float(values.mean()),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "per_image_ms": float(values.mean() / batch_size),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("images", nargs="*", help="image files or glob patterns")
+    parser.add_argument("--model", default=MODEL_PATH)
+    parser.add_argument("--backends", nargs="+", default=["onnx:fp32"],
+                        help="backend:precision pairs, e.g. onnx:int8 openvino:fp16")
+    parser.add_argument("--threads", type=int, default=0)
+    parser.add_argument("--calibration-dir", help="images for OpenVINO INT8 calibration")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 5])
+    parser.add_argument("--repeats", type=int, default=3)
+    # Varsayılanlar sunucunun (main.py) her çağrıda verdiği ayarlar
+    parser.add_argument("--conf", type=float, default=NMS_SETTINGS["conf"])
+    parser.add_argument("--iou", type=float, default=NMS_SETTINGS["iou"])
+    parser.add_argument("--max-det", type=int, default=NMS_SETTINGS["max_det"])
+    parser.add_argument("--synthetic", type=int, default=10, help="random frames when no images are given")
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    from ultralytics import YOLO
+
+    images = load_images(args.images, args.synthetic)
+    reference_model = YOLO(args.model)
+    if args.threads:
+        import torch
+        torch.set_num_threads(args.threads)
+
+    # Her altyapı main.py'deki gibi çağrılır: ayarlar öznitelik değil çağrı argümanı
+    settings = {"conf": args.conf, "iou": args.iou, "max_det": args.max_det}
+
+    def runner(model):
+        return lambda batch: model(batch, verbose=False, **settings)
+
+    run_torch = runner(reference_model)
+    runners = {"torch": run_torch}
+    for spec in args.backends:
+        backend, _, precision = spec.partition(":")
+        exported = load_exported_model(args.model, backend, precision or "fp32",
+                                       threads=args.threads, import_yolo=lambda: YOLO,
+                                       calibration_dir=args.calibration_dir)
+        runners[spec] = runner(exported)
+
+    def detections(run):
+        rows = []
+        for image in images:
+            data = run([image])[0].boxes.data
+            rows.append(np.asarray(data.cpu() if hasattr(data, "cpu") else data, dtype=np.float64).reshape(-1, 6))
+        return rows
+
+    reference = detections(run_torch)
+    report = {"images": len(images), "reference_detections": int(sum(len(r) for r in reference)), "backends": {},
+              "nms": settings}
+    for name, run in runners.items():
+        result = {"latency": [summarize(time_backend(run, images, size, args.repeats), size)
+                              for size in args.batch_sizes]}
+        if name != "torch":
+            candidate = detections(run)
+            matched, ious = 0, []
+            for ref, cand in zip(reference, candidate):
+                count, pair_ious = match(ref, cand)
+                matched += count
+                ious.extend(pair_ious)
+            total_ref = sum(len(r) for r in reference)
+            total_cand = sum(len(c) for c in candidate)
+            result["accuracy"] = {
+                "detections": total_cand,
+                "recall_vs_torch": matched / total_ref if total_ref else 1.0,
+                "precision_vs_torch": matched / total_cand if total_cand else 1.0,
+                "mean_iou": float(np.mean(ious)) if ious else None,
+            }
+        report["backends"][name] = result
+
+    print(f"{'backend':<16}{'batch':>6}{'mean ms':>10}{'p95 ms':>10}{'ms/img':>9}{'recall':>9}{'prec.':>9}{'IoU':>7}")
+    for name, result in report["backends"].items():
+        accuracy = result.get("accuracy", {})
+        for latency in result["latency"]:
+            print(f"{name:<16}{latency['batch_size']:>6}{latency['mean_ms']:>10.1f}{latency['p95_ms']:>10.1f}"
+                  f"{latency['per_image_ms']:>9.1f}"
+                  f"{accuracy.get('recall_vs_torch', 1.0):>9.3f}{accuracy.get('precision_vs_torch', 1.0):>9.3f}"
+                  f"{accuracy.get('mean_iou') or 1.0:>7.3f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+class HazardGrid:
+    """Uniform-grid spatial hash of hazard boxes for human proximity checks.
+
+    Every hazard is stored in each ``cell_size`` x ``cell_size`` cell its box
+    touches. With ``cell_size`` at least the largest distance threshold, a
+    hazard in range of a human always shares a cell with the human box grown
+    by that threshold, so a query only looks at the few cells around the
+    human instead of every hazard in the frame.
+
+    Entries are keyed so the grid can be kept across frames: ``sync`` with
+    the hazards of a new frame only re-buckets boxes whose cell range
+    changed (static hazards such as ``cukur`` stay put) and removes the keys
+    that are gone.
+    """
+
+    def __init__(self, cell_size):
+        self.cell_size = float(cell_size)
+        self.cells = {}    # (cx, cy) -> anahtar kümesi
+        self.entries = {}  # anahtar -> (kutu, hücre aralığı, öğe)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _span(self, box, margin=0.0):
+        size = self.cell_size
+        x1, y1, x2, y2 = box
+        if x2 < x1:
+            x1, x2 = x2, x1
+        if y2 < y1:
+            y1, y2 = y2, y1
+        return (int((x1 - margin) // size), int((y1 - margin) // size),
+                int((x2 + margin) // size), int((y2 + margin) // size))
+
+    @staticmethod
+    def _cells_of(span):
+        x1, y1, x2, y2 = span
+        return [(cx, cy) for cx in range(x1, x2 + 1) for cy in range(y1, y2 + 1)]
+
+    def update(self, key, box, item=None):
+        """Insert or move ``key``; the cells are only touched when its span changes."""
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] == box:
+            self.entries[key] = (box, entry[1], item)
+            return
+        span = self._span(box)
+        if entry is not None and entry[1] == span:
+            self.entries[key] = (box, span, item)
+            return
+        if entry is not None:
+            self._unlink(key, entry[1])
+        cells = self.cells
+        for cell in self._cells_of(span):
+            keys = cells.get(cell)
+            if keys is None:
+                cells[cell] = {key}
+            else:
+                keys.add(key)
+        self.entries[key] = (box, span, item)
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self._unlink(key, entry[1])
+
+    def _unlink(self, key, span):
+        for cell in self._cells_of(span):
+            keys = self.cells.get(cell)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.cells[cell]
+
+    def sync(self, items):
+        """Make the grid hold exactly ``items``, an iterable of ``(key, box, item)``."""
+        current = set()
+        for key, box, item in items:
+            current.add(key)
+            self.update(key, box, item)
+        if len(current) != len(self.entries):
+            for key in [key for key in self.entries if key not in current]:
+                self.remove(key)
+
+    def query(self, box, margin):
+        """Items of the entries whose cells touch ``box`` grown by ``margin``."""
+        found = set()
+        for cell in self._cells_of(self._span(box, margin)):
+            keys = self.cells.get(cell)
+            if keys:
+                found.update(keys)
+        return [self.entries[key][2] for key in found]
+
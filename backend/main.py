@@ -1,27 +1,200 @@
 import os
-from fastapi import FastAPI, WebSocket
+import base64
+import json
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, PlainTextResponse
 import cv2
 import numpy as np
-import json
-import base64
+import time
+import asyncio
+import threading
+import traceback
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from postprocess import LEVEL_RANK, DetectionPostProcessor
+from protocol import ControlMessage, parse_message
+from scheduler import BatchScheduler
+from backends import NMS_SETTINGS, StubModel, load_exported_model
+from metrics import MetricsRegistry
+from motion_gate import MotionGate
+from preprocess import QUALITY_MODES, VARIANT_NAMES, VariantPreprocessor
+from result_cache import ResultCache
+from result_codec import ResultEncoder
+from tiling import TilePlanner
+from tracker import StreamTracker
+from video_stream import VideoStream
+
+# Sunucu başlangıcından hazır olmaya kadar geçen süre bu andan itibaren ölçülür
+PROCESS_START = time.perf_counter()
+
+class DummyYOLO:
+    def __init__(self, *args, **kwargs): pass
+    def __call__(self, source, *args, **kwargs):
+        class DummyResults:
+            def __init__(self):
+                self.boxes = type('obj', (object,), {'data': []})
+                self.names = {}
+        # Liste verildiğinde her görüntü için ayrı sonuç döndür (toplu çıkarım)
+        count = len(source) if isinstance(source, list) else 1
+        return [DummyResults() for _ in range(count)]
+
+# ultralytics (ve torch) içe aktarımı saniyeler sürer; modül yüklenirken değil,
+# model yüklenirken arka planda yapılır. Bu sırada sunucu istek kabul eder.
+YOLO = None
+model = None
+
+def import_yolo():
+    """Import the ultralytics ``YOLO`` class on first use."""
+    global YOLO
+    if YOLO is None:
+        # Try to import YOLO - if fails, provide guidance
+        try:
+            from ultralytics import YOLO as yolo_class
+        except ImportError:
+            print("ERROR: ultralytics not properly installed. Run: pip install ultralytics")
+            yolo_class = DummyYOLO
+        YOLO = yolo_class
+    return YOLO
 
-# Try to import YOLO - if fails, provide guidance
-try:
-    from ultralytics import YOLO
-    model = None
-except ImportError:
-    print("ERROR: ultralytics not properly installed. Run: pip install ultralytics")
-    class DummyYOLO:
-        def __init__(self, *args, **kwargs): pass
-        def __call__(self, *args, **kwargs):
-            class DummyResults:
-                def __init__(self):
-                    self.boxes = type('obj', (object,), {'data': []})
-                    self.names = {}
-            return [DummyResults()]
-    model = None
+# Çıkarım altyapısı: torch (ultralytics), onnx (ONNX Runtime), openvino veya stub.
+# onnx/openvino için best.pt bir kez dışa aktarılır ve ağırlıkların yanında saklanır.
+# stub model dosyası gerektirmez; ölçümler için sabit sayıda yapay kutu üretir.
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch").lower()
+# fp32, fp16 veya int8 (yalnızca onnx/openvino)
+INFERENCE_PRECISION = os.getenv("INFERENCE_PRECISION", "fp32").lower()
+# Çıkarım başına işlemci iş parçacığı sayısı (0 = çalışma zamanının varsayılanı).
+# INFERENCE_WORKERS ile çarpımı çekirdek sayısını aşmamalı.
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "0"))
+# OpenVINO INT8 dışa aktarımında kalibrasyon için şantiye görüntülerinin klasörü
+INFERENCE_CALIBRATION_DIR = os.getenv("INFERENCE_CALIBRATION_DIR") or None
+# stub altyapısında görüntü başına sınıf bazında kutu sayısı ("sınıf=sayı", virgülle ayrılmış)
+STUB_BOXES = {
+    name: int(count) for name, count in
+    (item.split("=", 1) for item in os.getenv("STUB_BOXES", "insan=3,Kasksiz=1,cukur=1").split(",") if "=" in item)
+}
+# stub altyapısında görüntü başına yapay çıkarım süresi
+STUB_LATENCY_MS = float(os.getenv("STUB_LATENCY_MS", "0"))
+
+# Model sunucu açılışında yüklenip örnek karelerle ısıtılır; ilk kamera beklemez.
+# EAGER_MODEL_LOAD=0 ile eski davranışa (ilk karede yükleme) dönülür.
+EAGER_MODEL_LOAD = os.getenv("EAGER_MODEL_LOAD", "1") != "0"
+# Isıtmada kullanılan kare boyutları (GENİŞLİKxYÜKSEKLİK, virgülle ayrılmış)
+WARMUP_SIZES = [
+    tuple(int(v) for v in size.lower().split("x"))
+    for size in os.getenv("WARMUP_SIZES", "640x480,480x640").split(",") if size.strip()
+]
+
+# Açılış durumu - "/" bu bilgiyle hazır olup olmadığını bildirir
+startup_status = {
+    "ready": not EAGER_MODEL_LOAD,
+    "phase": "starting" if EAGER_MODEL_LOAD else "lazy",
+    "error": None,
+    "timings_ms": {},
+}
+
+# Yüklenen görüntülerin tüm varyantlarını tek ileri geçişte (batch) işle.
+# Karşılaştırma için BATCHED_INFERENCE=0 ile eski sıralı davranışa dönülebilir.
+BATCHED_INFERENCE = os.getenv("BATCHED_INFERENCE", "1") != "0"
+
+# Kod çözme, ön işleme ve model çağrıları olay döngüsü yerine bu havuzda çalışır.
+# Torch ve OpenCV çağrıları GIL'i bıraktığı için iş parçacığı havuzu yeterlidir.
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "2"))
+# Bağlantı başına işlenmeyi bekleyebilecek en fazla webcam karesi
+FRAME_QUEUE_SIZE = int(os.getenv("FRAME_QUEUE_SIZE", "1"))
+# Bağlantı başına bekleyebilecek en fazla yükleme; dolunca yeni mesaj alınmaz (geri basınç)
+UPLOAD_QUEUE_SIZE = int(os.getenv("UPLOAD_QUEUE_SIZE", "4"))
+inference_executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+
+# Bağlantılar arası mikro-toplama: tüm kameralardan gelen kareler tek ileri geçişte
+# işlenir. MICRO_BATCHING=0 ile her bağlantı modeli kendisi çağırır.
+MICRO_BATCHING = os.getenv("MICRO_BATCHING", "1") != "0"
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "8"))
+MAX_BATCH_WAIT_MS = float(os.getenv("MAX_BATCH_WAIT_MS", "5"))
+# İsteğe bağlı uçtan uca gecikme bütçesi (ms) - aşılacaksa parti erken gönderilir
+BATCH_LATENCY_BUDGET_MS = float(os.getenv("BATCH_LATENCY_BUDGET_MS", "0")) or None
+
+# Hareketsiz webcam karelerinde modeli atla; son tespitler yeniden gönderilir.
+# Eşik, küçültülmüş gri karede bölge başına ortalama piksel farkıdır (0-255).
+MOTION_GATE = os.getenv("MOTION_GATE", "1") != "0"
+MOTION_GATE_THRESHOLD = float(os.getenv("MOTION_GATE_THRESHOLD", "6"))
+# Bu kadar kare veya saniye atlandıktan sonra model yine de çalıştırılır
+MOTION_GATE_MAX_SKIP_FRAMES = int(os.getenv("MOTION_GATE_MAX_SKIP_FRAMES", "30"))
+MOTION_GATE_MAX_SKIP_SECONDS = float(os.getenv("MOTION_GATE_MAX_SKIP_SECONDS", "1.0"))
+
+# Sunucunun kendisinin açtığı video kaynakları: "kimlik=kaynak" çiftleri, virgülle ayrılmış.
+# Kaynak bir dosya yolu, akış adresi (rtsp://, http://) veya yerel kamera dizini olabilir.
+# Her kaynak /streams/{kimlik} üzerinden izlenir; izleyici sayısından bağımsız tek çıkarım akışı.
+VIDEO_SOURCES = dict(
+    item.split("=", 1) for item in os.getenv("VIDEO_SOURCES", "").split(",") if "=" in item
+)
+# İzleyicilere işlenen karenin JPEG önizlemesi de gönderilir
+VIDEO_PREVIEW = os.getenv("VIDEO_PREVIEW", "1") != "0"
+VIDEO_PREVIEW_QUALITY = int(os.getenv("VIDEO_PREVIEW_QUALITY", "70"))
+
+# Yüklenen görüntülerin sonuç önbelleği (görüntü içeriği + model + eşikler ile anahtarlanır).
+# RESULT_CACHE_DIR verilirse kayıtlar diske de yazılır ve yeniden başlatmada korunur.
+RESULT_CACHE = os.getenv("RESULT_CACHE", "1") != "0"
+RESULT_CACHE_MAX_ENTRIES = int(os.getenv("RESULT_CACHE_MAX_ENTRIES", "256"))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR") or None
+result_cache = ResultCache(
+    max_entries=RESULT_CACHE_MAX_ENTRIES,
+    max_bytes=RESULT_CACHE_MAX_BYTES,
+    directory=RESULT_CACHE_DIR,
+) if RESULT_CACHE else None
+
+# Yüklenen görüntülerin varyantları: ortak çekirdek/tablolar ve boyut başına tampon havuzu
+preprocessor = VariantPreprocessor()
+
+# Yükleme kalite modu: fast (yalnızca orijinal), balanced (BALANCED_VARIANTS) veya full (tüm varyantlar).
+# İstemci detect mesajındaki "quality" alanıyla görüntü başına seçebilir.
+UPLOAD_QUALITY = os.getenv("UPLOAD_QUALITY", "full").lower()
+BALANCED_VARIANTS = tuple(
+    name.strip() for name in os.getenv("BALANCED_VARIANTS", "Orijinal,Geliştirilmiş,Yangın Maskeli").split(",")
+    if name.strip()
+)
+# balanced modda pikselleri bu orandan azı ateş rengindeyse yangın maskeli varyant atlanır
+FIRE_MASK_MIN_COVERAGE = float(os.getenv("FIRE_MASK_MIN_COVERAGE", "0.002"))
+QUALITY_VARIANTS = {"fast": ("Orijinal",), "balanced": BALANCED_VARIANTS, "full": VARIANT_NAMES}
+
+# Varyant başına katkı: kaç görüntüde çalıştı, kaç tespit buldu ve kaçını yalnızca o buldu.
+# balanced modun varyant listesi bu sayılarla ayarlanır - /stats
+# Yalnızca yüklemeler sayılır; çıkarım havuzunun iş parçacıkları birlikte güncellediği için kilitli
+variant_stats = {name: {"frames": 0, "detections": 0, "unique": 0} for name in VARIANT_NAMES}
+variant_stats_lock = threading.Lock()
+
+# Geniş açılı kameralarda uzaktaki çalışanlar için karolu çıkarım: 640 geçişinden sonra
+# insan ve tehlike bölgeleri yerel çözünürlükte karolar halinde, tek toplu geçişte yeniden incelenir.
+TILED_INFERENCE = os.getenv("TILED_INFERENCE", "0") == "1"
+TILE_SIZE = int(os.getenv("TILE_SIZE", "640"))
+# Kare başına en fazla karo - ek maliyetin üst sınırı
+TILE_BUDGET = int(os.getenv("TILE_BUDGET", "4"))
+# Karolar yalnızca yerel çözünürlük 640'lık karenin en az bu katıysa çalışır
+TILE_MIN_SCALE = float(os.getenv("TILE_MIN_SCALE", "1.5"))
+# Karo tespitlerinin "source" adı
+TILE_SOURCE = "Yüksek Çözünürlük"
+variant_stats[TILE_SOURCE] = {"frames": 0, "detections": 0, "unique": 0}
+
+# Kare başına ayrıntılı günlükler (görüntü boyutu, varyant tespitleri, tehlike olayları).
+# Kapalıyken bu mesajlar hiç oluşturulmaz; aşama süreleri /metrics üzerinden izlenir.
+VERBOSE_LOGGING = os.getenv("VERBOSE_LOGGING", "0") == "1"
+
+# Aşama bazında gecikme histogramları (bağlantı başına ve genel) - /metrics
+metrics = MetricsRegistry()
+
+# Bağlantılar genelinde sayaçlar - /stats üzerinden okunur
+connection_stats = {
+    "active_connections": 0,
+    "processed_frames": 0,
+    "dropped_frames": 0,
+    "gate_checked_frames": 0,
+    "gate_skipped_frames": 0,
+    "gate_ms_total": 0.0,
+}
+# Kompakt sonuç kodlamasında tam ve delta mesaj sayıları (tüm bağlantılar)
+encoding_stats = {"full_messages": 0, "delta_messages": 0}
 
 app = FastAPI()
 
@@ -34,63 +207,117 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-class BoxSmoother:
-    def __init__(self, history_length=5):
-        self.history = {}  # Her nesne için koordinat geçmişi
-        self.history_length = history_length
-    
-    def update(self, box_id, coords):
-        if box_id not in self.history:
-            self.history[box_id] = deque(maxlen=self.history_length)
-        self.history[box_id].append(coords)
-        
-    def get_smoothed_coords(self, box_id):
-        if box_id not in self.history:
-            return None
-        return np.mean(self.history[box_id], axis=0)
-    
-    def clean_old_entries(self, current_ids):
-        # Artık görünmeyen nesnelerin geçmişini temizle
-        self.history = {k: v for k, v in self.history.items() if k in current_ids}
-
-# Global smoother instance
-box_smoother = BoxSmoother()
+model_lock = threading.Lock()
+# Yüklü model dosyasının kimliği (yol, boyut, değiştirilme zamanı) - önbellek anahtarında kullanılır
+model_identity = None
 
 # Load YOLO model when needed
 def get_model():
+    if model is not None:
+        return model
+    with model_lock:
+        return _load_model()
+
+def _load_model():
     global model
     if model is None:
         try:
+            global model_identity, ALL_CLASSES
+            if INFERENCE_BACKEND == "stub":
+                print(f"Yapay model kullanılıyor: {STUB_BOXES}, {STUB_LATENCY_MS} ms")
+                model = StubModel({idx: name for name, idx in ALL_CLASSES.items()},
+                                  STUB_BOXES, latency_ms=STUB_LATENCY_MS)
+                model_identity = f"stub:{sorted(STUB_BOXES.items())}:{STUB_LATENCY_MS}"
+                return model
+
             # Model dosyasının var olup olmadığını kontrol et
             model_path = os.path.join(os.path.dirname(__file__), "models", "best.pt")
             if not os.path.exists(model_path):
                 raise FileNotFoundError(f"Model dosyası bulunamadı: {model_path}")
             
-            print(f"Model yükleniyor: {model_path}")
-            model = YOLO(model_path)
+            print(f"Model yükleniyor: {model_path} ({INFERENCE_BACKEND}, {INFERENCE_PRECISION})")
+            if INFERENCE_BACKEND == "torch":
+                model = import_yolo()(model_path)
+                if INFERENCE_THREADS:
+                    import torch
+                    torch.set_num_threads(INFERENCE_THREADS)
+            else:
+                model = load_exported_model(
+                    model_path, INFERENCE_BACKEND, INFERENCE_PRECISION,
+                    threads=INFERENCE_THREADS, import_yolo=import_yolo,
+                    calibration_dir=INFERENCE_CALIBRATION_DIR,
+                )
+            stat = os.stat(model_path)
+            model_identity = (f"{model_path}:{stat.st_size}:{stat.st_mtime_ns}:"
+                              f"{INFERENCE_BACKEND}:{INFERENCE_PRECISION}")
             
             # Model sınıflarını al ve yazdır
             model_classes = model.names
             print("Model sınıfları:", model_classes)
             
             # ALL_CLASSES'ı model sınıflarıyla güncelle
-            global ALL_CLASSES
             ALL_CLASSES = {name: idx for idx, name in model_classes.items()}
             print("Güncellenen ALL_CLASSES:", ALL_CLASSES)
             
-            # Model yapılandırmasını güncelle
-            model.conf = 0.25  # Güven eşiğini artır
-            model.iou = 0.45   # IoU eşiğini artır
-            model.max_det = 50  # Maksimum tespit sayısını azalt
+            # Güven/IoU eşikleri ve en fazla tespit sayısı (NMS_SETTINGS) her çağrıda verilir
             print(f"Model başarıyla yüklendi ve yapılandırıldı")
             
         except Exception as e:
             print(f"Model yükleme hatası: {e}")
-            import traceback
             print(traceback.format_exc())
             raise e
     return model
 
+def warmup_model():
+    """Load the model and run it on dummy frames before the first client.
+
+    The first model calls allocate buffers and pick kernels, so each
+    ``WARMUP_SIZES`` frame goes through the webcam path (one image) and the
+    upload path (all enhanced variants in one batch). Phase times and the
+    total time-to-ready are stored in ``startup_status``.
+    """
+    timings = startup_status["timings_ms"]
+    try:
+        if INFERENCE_BACKEND == "torch":
+            startup_status["phase"] = "importing"
+            start = time.perf_counter()
+            import_yolo()
+            timings["import"] = (time.perf_counter() - start) * 1000
+
+        startup_status["phase"] = "loading"
+        start = time.perf_counter()
+        yolo_model = get_model()
+        timings["load"] = (time.perf_counter() - start) * 1000
+
+        startup_status["phase"] = "warming_up"
+        start = time.perf_counter()
+        for width, height in WARMUP_SIZES:
+            frame = np.full((height, width, 3), 114, dtype=np.uint8)
+            variants, _, buffers = preprocessor.build(frame)
+            yolo_model([frame], verbose=False, **NMS_SETTINGS)
+            yolo_model([image for _, image in variants], verbose=False, **NMS_SETTINGS)
+            preprocessor.release(buffers)
+        timings["warmup"] = (time.perf_counter() - start) * 1000
+
+        timings["time_to_ready"] = (time.perf_counter() - PROCESS_START) * 1000
+        startup_status["phase"] = "ready"
+        startup_status["ready"] = True
+        print(f"Model hazır - açılış süreleri (ms): {timings}")
+    except Exception as e:
+        startup_status["phase"] = "failed"
+        startup_status["error"] = str(e)
+        print(f"Model ısıtma hatası: {e}")
+
+@app.on_event("startup")
+async def start_model_warmup():
+    if EAGER_MODEL_LOAD:
+        # Ayrı iş parçacığında: sunucu bu sırada bağlantı kabul eder, "/" hazır değil der
+        threading.Thread(target=warmup_model, name="model-warmup", daemon=True).start()
+
+def get_model_identity():
+    get_model()
+    return model_identity or "unknown"
+
 # All classes that our model can detect - bu sadece referans, model yüklenince güncelleniyor
 ALL_CLASSES = {
     'cukur': 0,
@@ -152,6 +379,31 @@ HUMAN_PRIORITY = {
     'insan': 5,    # En düşük öncelik
 }
 
+# Birleştirme, insan filtreleme ve tehlike kontrolü NumPy matrisleriyle yapılır.
+# POSTPROCESS_ENGINE=python eski saf Python döngülerini (referans) kullanır.
+POSTPROCESS_ENGINE = os.getenv("POSTPROCESS_ENGINE", "numpy")
+postprocessor = DetectionPostProcessor(HAZARD_CLASSES, NON_HAZARD_CLASSES, HUMAN_CLASSES, HUMAN_PRIORITY)
+tile_planner = TilePlanner(HUMAN_CLASSES, HAZARD_CLASSES, tile_size=TILE_SIZE, budget=TILE_BUDGET)
+
+def result_cache_config(quality=UPLOAD_QUALITY, native_shape=None):
+    """Settings that change upload results; part of every result cache key.
+
+    ``native_shape`` is the full-resolution size of a frame that gets the
+    tiled second pass.
+    """
+    config = {
+        "hazard_classes": HAZARD_CLASSES,
+        "non_hazard_classes": NON_HAZARD_CLASSES,
+        "nms": NMS_SETTINGS,
+        "quality": quality,
+        "variants": QUALITY_VARIANTS[quality],
+    }
+    if quality == "balanced":
+        config["fire_mask_min_coverage"] = FIRE_MASK_MIN_COVERAGE
+    if native_shape is not None:
+        config["tiles"] = {"native_shape": native_shape, "size": TILE_SIZE, "budget": TILE_BUDGET}
+    return config
+
 def calculate_distance(box1, box2):
     """Calculate the minimum distance between two bounding boxes."""
     # Kutular [x1, y1, x2, y2] formatında
@@ -220,244 +472,767 @@ def check_danger(human_box, hazard_box, hazard_type):
     
     return False, None
 
+def inference_ms_by_variant(names, results, total_ms):
+    """Per-variant inference time of one batched model call."""
+    timings = {}
+    for name, result in zip(names, results):
+        # Ultralytics her sonuç için toplu sürenin görüntü başına payını raporlar
+        speed = getattr(result, "speed", None) or {}
+        if speed.get("inference") is not None:
+            timings[name] = speed["inference"]
+        else:
+            timings[name] = total_ms / len(names)
+    return timings
+
+def run_batched_inference(yolo_model, variants, batched=True):
+    """Run the model on all ``(name, image)`` variants.
+
+    With ``batched`` the images are passed as one list, so the model stacks
+    them into a single tensor and runs one forward pass. The results are split
+    back into the ``(name, result)`` list expected by the post-processing.
+    """
+    names = [name for name, _ in variants]
+    timings = {"inference_ms": {}, "batched": batched}
+
+    start = time.perf_counter()
+    if batched:
+        results = yolo_model([image for _, image in variants], verbose=VERBOSE_LOGGING, **NMS_SETTINGS)
+        total_ms = (time.perf_counter() - start) * 1000
+        timings["inference_ms"] = inference_ms_by_variant(names, results, total_ms)
+    else:
+        results = []
+        for name, image in variants:
+            variant_start = time.perf_counter()
+            results.append(yolo_model(image, verbose=VERBOSE_LOGGING, **NMS_SETTINGS)[0])
+            timings["inference_ms"][name] = (time.perf_counter() - variant_start) * 1000
+        total_ms = (time.perf_counter() - start) * 1000
+    timings["inference_total_ms"] = total_ms
+
+    return list(zip(names, results)), timings
+
+def decode_frame(request, timings=None):
+    """Decode the request's image at its native resolution (``decode_ms`` in ``timings``)."""
+    # Decode image
+    start = time.perf_counter()
+    nparr = request.image_buffer()
+    frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+    if timings is not None:
+        timings["decode_ms"] = (time.perf_counter() - start) * 1000
+
+    if frame is None:
+        raise ValueError("Invalid image data")
+
+    # Görüntü boyutunu yazdır (debug için)
+    if VERBOSE_LOGGING:
+        print(f"Alınan görüntü boyutu: {frame.shape}")
+
+    return frame
+
+def resize_frame(frame, timings=None):
+    """Scale ``frame`` so the longest side is at most 640 (``resize_ms`` in ``timings``)."""
+    # Görüntü boyutunu normalize et - 640x640 veya yakın bir değere ayarla
+    # Bu, model için daha iyi tespit sonuçları verebilir
+    start = time.perf_counter()
+    max_dim = max(frame.shape[0], frame.shape[1])
+    if max_dim > 640:
+        scale = 640 / max_dim
+        new_width = int(frame.shape[1] * scale)
+        new_height = int(frame.shape[0] * scale)
+        frame = cv2.resize(frame, (new_width, new_height))
+        if VERBOSE_LOGGING:
+            print(f"Görüntü boyutu yeniden düzenlendi: {frame.shape}")
+    if timings is not None:
+        timings["resize_ms"] = (time.perf_counter() - start) * 1000
+    return frame
+
+class StreamState:
+    """Per-stream state of a webcam connection: tracker, motion gate, last result."""
+    def __init__(self):
+        self.tracker = StreamTracker()
+        self.motion_gate = MotionGate(
+            threshold=MOTION_GATE_THRESHOLD,
+            max_skip_frames=MOTION_GATE_MAX_SKIP_FRAMES,
+            max_skip_seconds=MOTION_GATE_MAX_SKIP_SECONDS,
+        ) if MOTION_GATE else None
+        self.last_detections = None
+
+    def tracker_for(self, request):
+        # Yüklenen görüntüler birbirinden bağımsızdır, yalnızca webcam akışı izlenir
+        return self.tracker if request.is_webcam else None
+
+class PreparedFrame:
+    """Output of ``prepare_frame``: what still has to run for one request.
+
+    ``response`` is set when no inference is needed (motion gate skip or a
+    result cache hit); otherwise ``variants`` go through the model and
+    ``cache_key`` (uploads only) names the cache entry for the result.
+    ``timings`` collects the stage durations of the request in milliseconds.
+    ``buffers`` is the ``preprocessor`` buffer set holding the upload
+    variants; ``finish_frame`` returns it once the model call is done.
+    ``quality`` is the upload quality mode (``None`` for webcam frames).
+    ``native`` is the full-resolution frame when tiled inference applies.
+    """
+    __slots__ = ("variants", "timings", "cache_key", "response", "buffers", "quality", "native")
+
+    def __init__(self, variants=None, timings=None, cache_key=None, response=None, buffers=None, quality=None,
+                 native=None):
+        self.variants = variants
+        self.timings = timings
+        self.cache_key = cache_key
+        self.response = response
+        self.buffers = buffers
+        self.quality = quality
+        self.native = native
+
+def prepare_frame(request, state=None):
+    """Decode a frame and build the image variants to run through the model.
+
+    Webcam frames run only the original image and may be skipped by the
+    stream's motion gate. Uploads use the enhanced variants of the request's
+    quality mode, unless the same image was analyzed before and is still in
+    ``result_cache``.
+    """
+    timings = {}
+    native = decode_frame(request, timings)
+    frame = resize_frame(native, timings)
+    return prepare_decoded(frame, request.is_webcam, state, timings, request.quality, native)
+
+def tiling_source(frame, native):
+    """The full-resolution frame when it gets the tiled second pass, else ``None``."""
+    if not TILED_INFERENCE or native is None or TILE_BUDGET <= 0:
+        return None
+    return native if native.shape[1] >= frame.shape[1] * TILE_MIN_SCALE else None
+
+def prepare_decoded(frame, is_webcam, state=None, timings=None, quality=None, native=None):
+    """``prepare_frame`` for an already decoded and resized frame.
+
+    ``native`` is the frame before resizing, used by tiled inference.
+    """
+    timings = {} if timings is None else timings
+    native = tiling_source(frame, native)
+
+    # Webcam modu için optimizasyon - sadece orijinal kareyi işle
+    if is_webcam:
+        gate = state.motion_gate if state is not None else None
+        # İlk kareyi (henüz gönderilecek sonuç yokken) her durumda modelden geçir
+        infer = gate is None or gate.should_infer(frame)
+        if gate is not None:
+            timings["gate_ms"] = gate.last_cost * 1000
+        if not infer and state.last_detections is not None:
+            return PreparedFrame(response=skipped_response(state, timings))
+        return PreparedFrame([("Orijinal", frame)], timings, native=native)
+
+    quality = (quality or UPLOAD_QUALITY).lower()
+    if quality not in QUALITY_MODES:
+        raise ValueError(f"Unknown quality mode: {quality}")
+
+    cache_key = None
+    if result_cache is not None:
+        start = time.perf_counter()
+        # Karolu geçiş yerel pikselleri okur - anahtar küçültülmüş kareden değil ondan üretilir
+        cache_key = ResultCache.make_key(frame if native is None else native, get_model_identity(), result_cache_config(
+            quality, native.shape if native is not None else None
+        ))
+        detections = result_cache.get(cache_key)
+        timings["cache_lookup_ms"] = (time.perf_counter() - start) * 1000
+        if detections is not None:
+            return PreparedFrame(response={
+                "status": "success",
+                "detections": detections,
+                "message": f"Detected {len(detections)} objects",
+                "quality": quality,
+                "cached": True,
+                "timings": timings
+            })
+
+    # Yüklenen görüntüler için kalite moduna göre iyileştirmeler
+    if quality == "fast":
+        return PreparedFrame([("Orijinal", frame)], timings, cache_key, quality=quality, native=native)
+    min_fire_coverage = FIRE_MASK_MIN_COVERAGE if quality == "balanced" else 0.0
+    variants, variant_timings, buffers = preprocessor.build(frame, QUALITY_VARIANTS[quality], min_fire_coverage)
+    timings.update(variant_timings)
+    return PreparedFrame(variants, timings, cache_key, buffers=buffers, quality=quality, native=native)
+
+def skipped_response(state, timings=None):
+    """Re-send the last detections of a stream whose frame was gated out."""
+    detections = state.last_detections
+    response = {
+        "status": "success",
+        "detections": detections,
+        "message": f"Detected {len(detections)} objects",
+        "skipped": True
+    }
+    if timings is not None:
+        response["timings"] = timings
+    return response
+
+def plan_tiles(prepared, results_list):
+    """Native-resolution tiles for the second pass of a tiled frame."""
+    return tile_planner.plan(results_list, prepared.variants[0][1].shape, prepared.native.shape)
+
+def add_tile_results(prepared, results_list, tiles, results, start):
+    """Append the tiles' detections, in frame coordinates, as one more variant."""
+    frame_shape = prepared.variants[0][1].shape
+    results_list.append((TILE_SOURCE, tile_planner.merge(results, tiles, frame_shape, prepared.native.shape)))
+    prepared.timings["tiles"] = len(tiles)
+    prepared.timings["tile_inference_ms"] = (time.perf_counter() - start) * 1000
+
+def run_tile_pass(yolo_model, prepared, results_list):
+    """Second pass of tiled inference: all planned tiles in one model call (blocking)."""
+    tiles = plan_tiles(prepared, results_list)
+    if tiles:
+        start = time.perf_counter()
+        results = yolo_model(tile_planner.crop(prepared.native, tiles), verbose=VERBOSE_LOGGING, **NMS_SETTINGS)
+        add_tile_results(prepared, results_list, tiles, results, start)
+
+def finish_frame(prepared, results_list, tracker=None):
+    """Post-process the model output and store upload results in the cache."""
+    # Model çağrısı bitti, varyant görüntüleri artık kullanılmıyor
+    preprocessor.release(prepared.buffers)
+    prepared.buffers = None
+    response = analyze_results(results_list, prepared.timings, tracker, upload=prepared.quality is not None)
+    if prepared.quality is not None:
+        response["quality"] = prepared.quality
+    if prepared.cache_key is not None:
+        result_cache.put(prepared.cache_key, response["detections"])
+    return response
+
+def process_frame(request, state=None):
+    """Decode one frame, run detection and build the response payload.
+
+    This is blocking work (decode, preprocessing, model call and
+    post-processing) and is meant to run inside ``inference_executor``.
+    """
+    prepared = prepare_frame(request, state)
+    if prepared.response is not None:
+        return prepared.response
+
+    # Farklı işlenmiş görüntüler üzerinde tespit deneyin
+    yolo_model = get_model()
+
+    if VERBOSE_LOGGING:
+        print("Tespit işlemi başlıyor...")
+
+    results_list, inference_timings = run_batched_inference(
+        yolo_model, prepared.variants, batched=BATCHED_INFERENCE
+    )
+    prepared.timings.update(inference_timings)
+    if prepared.native is not None:
+        run_tile_pass(yolo_model, prepared, results_list)
+    if VERBOSE_LOGGING:
+        print(f"Varyant süreleri (ms): {prepared.timings}")
+
+    return finish_frame(prepared, results_list, state.tracker_for(request) if state else None)
+
+def log_danger(human, hazard, distance):
+    print(f"İnsan {hazard['class']} tehlikesinde! Mesafe: {distance}")
+
+def merge_detections_reference(raw_detections, default_conf):
+    """Pure-Python duplicate merge, kept as the reference for ``postprocessor``.
+
+    ``raw_detections`` holds ``(box, conf, class_name, source)`` tuples in
+    variant order. Selected with ``POSTPROCESS_ENGINE=python``.
+    """
+    # Tüm sonuçları birleştir
+    all_detections = []
+
+    for box, conf, class_name, name in raw_detections:
+        # Sınıfa özgü güven eşiğini al
+        class_conf_threshold = HAZARD_CLASSES.get(class_name, {}).get('conf_threshold', 
+                              NON_HAZARD_CLASSES.get(class_name, {}).get('conf_threshold', 
+                              default_conf))
+
+        # Check if this detection overlaps with any existing one
+        is_duplicate = False
+        for existing in all_detections:
+            if existing["class"] == class_name and calculate_iou(box, existing["box"]) > 0.3:
+                is_duplicate = True
+                # Keep the higher confidence one
+                if float(conf) > existing["confidence"]:
+                    existing["confidence"] = float(conf)
+                    existing["box"] = list(box)
+                break
+
+        # Add if not duplicate and meets confidence threshold
+        if not is_duplicate and conf >= class_conf_threshold:
+            detection = {
+                "box": list(box),
+                "confidence": float(conf),
+                "class": class_name,
+                "in_danger": class_name in HAZARD_CLASSES,
+                "danger_level": HAZARD_CLASSES.get(class_name, {}).get('level', None),
+                "safety_equipment": class_name in ['Kaskli', 'Yelekli'],
+                "source": name
+            }
+            all_detections.append(detection)
+
+    return all_detections
+
+def assess_dangers_reference(all_detections):
+    """Pure-Python human filter and danger check, the reference for ``postprocessor``."""
+    # Gruplandırma işlemi
+    human_boxes = [d for d in all_detections if d["class"] in HUMAN_CLASSES]
+    hazard_boxes = [d for d in all_detections if d["class"] in HAZARD_CLASSES]
+
+    # Filtreleme: Çakışan insan kutularını birleştir veya en önemlisini seç
+    filtered_humans = []
+    if human_boxes:
+        # Önceliğe göre sırala
+        human_boxes.sort(key=lambda x: HUMAN_PRIORITY.get(x["class"], 999))
+
+        for human in human_boxes:
+            # Daha önce eklenen kutularla çakışıyor mu kontrol et
+            should_add = True
+            for existing in filtered_humans:
+                if calculate_iou(human["box"], existing["box"]) > 0.3:  # %30'dan fazla çakışma varsa
+                    should_add = False
+                    break
+
+            if should_add:
+                # Kasksız ve Yeleksiz kişileri tehlike olarak işaretle
+                if human["class"] in ["Kasksiz", "Yeleksiz"]:
+                    human["in_danger"] = True
+                    human["danger_level"] = "high" if human["class"] == "Kasksiz" else "medium"
+                    human["danger_source"] = "Güvenlik ekipmanı eksikliği"
+
+                filtered_humans.append(human)
+
+    # Tehlike durumlarını kontrol et
+    for human in filtered_humans:
+        # Menzildeki tüm tehlikeler toplanır; en yüksek seviyeli (eşitse en yakın) kaynak olur
+        in_range = []
+        for index, hazard in enumerate(hazard_boxes):
+            is_danger, danger_level = check_danger(
+                human["box"], 
+                hazard["box"],
+                hazard["class"]
+            )
+            if is_danger:
+                distance = calculate_distance(human["box"], hazard["box"])
+                in_range.append((LEVEL_RANK.get(danger_level, len(LEVEL_RANK)), distance, index, hazard))
+        if in_range:
+            in_range.sort(key=lambda item: item[:3])
+            _, distance, _, hazard = in_range[0]
+            human["in_danger"] = True
+            human["danger_level"] = HAZARD_CLASSES[hazard["class"]]['level']
+            human["danger_source"] = hazard["class"]
+            human["hazards_in_range"] = [
+                {"class": h["class"], "level": HAZARD_CLASSES[h["class"]]['level'], "distance": round(float(d), 1)}
+                for _, d, _, h in in_range
+            ]
+            if VERBOSE_LOGGING:
+                log_danger(human, hazard, distance)
+
+    # Tehlikeli olmayan durumları ve tehlike kaynaklarını da dahil et
+    final_detections = filtered_humans + [h for h in all_detections if h["class"] not in HUMAN_CLASSES]
+
+    return final_detections
+
+def record_variant_contributions(results_list, raw_detections, all_detections, default_conf):
+    """Count, per variant, the merged detections it found and those only it found."""
+    contributors = postprocessor.contributors(all_detections, raw_detections, default_conf)
+    with variant_stats_lock:
+        for name, _ in results_list:
+            variant_stats[name]["frames"] += 1
+        for sources in contributors:
+            for name in sources:
+                variant_stats[name]["detections"] += 1
+            if len(sources) == 1:
+                variant_stats[next(iter(sources))]["unique"] += 1
+
+def analyze_results(results_list, timings=None, tracker=None, upload=False):
+    """Merge the per-variant detections, check dangers and build the response.
+
+    ``tracker`` is the connection's ``StreamTracker`` for webcam streams; it
+    smooths boxes, assigns track IDs and accumulates time in danger. Only
+    ``upload`` frames count towards ``variant_stats``.
+    """
+    start = time.perf_counter()
+
+    # Tüm varyantlardaki ham tespitleri topla
+    raw_detections = []
+
+    # Process all detections from all image variations
+    for name, results_set in results_list:
+        for r in results_set.boxes.data.tolist():
+            if len(r) < 6:
+                continue
+
+            x1, y1, x2, y2, conf, cls = r
+            class_id = int(cls)
+            class_name = results_set.names.get(class_id, "unknown")
+            raw_detections.append(([float(x1), float(y1), float(x2), float(y2)], conf, class_name, name))
+
+    # Her tespit kümesi için sonuçları yazdır
+    if VERBOSE_LOGGING:
+        for name, result in results_list:
+            detections = [class_name for _, _, class_name, source in raw_detections if source == name]
+            print(f"{name} görüntüde tespit edilen nesneler ({len(result.boxes)}): {detections}")
+
+    # Tüm sonuçları birleştir
+    if POSTPROCESS_ENGINE == "python":
+        all_detections = merge_detections_reference(raw_detections, NMS_SETTINGS["conf"])
+    else:
+        all_detections = postprocessor.merge(raw_detections, NMS_SETTINGS["conf"])
+    if upload and len(results_list) > 1:
+        record_variant_contributions(results_list, raw_detections, all_detections, NMS_SETTINGS["conf"])
+
+    # Koordinatları iz geçmişiyle yumuşat ve iz kimliklerini ata
+    if tracker is not None:
+        tracker.update(all_detections, time.monotonic())
+
+    if POSTPROCESS_ENGINE == "python":
+        final_detections = assess_dangers_reference(all_detections)
+    else:
+        final_detections = postprocessor.assess(
+            all_detections, on_danger=log_danger if VERBOSE_LOGGING else None, tracker=tracker
+        )
+
+    if tracker is not None:
+        tracker.record_danger_time(final_detections)
+
+    # İstemciye gönderilecek yanıt
+    response = {
+        "status": "success",
+        "detections": final_detections,
+        "message": f"Detected {len(final_detections)} objects"
+    }
+    if timings is not None:
+        timings["postprocess_ms"] = (time.perf_counter() - start) * 1000
+        response["timings"] = timings
+    if VERBOSE_LOGGING:
+        print(f"Toplam {len(final_detections)} nesne tespit edildi ve istemciye gönderilmek üzere hazırlandı.")
+    return response
+
+class FrameQueue:
+    """Bounded per-connection frame queue where the newest webcam frame wins.
+
+    Webcam frames beyond ``maxsize`` are dropped oldest-first because only the
+    latest camera image matters. Uploaded images are never dropped; once
+    ``max_uploads`` of them are pending, ``put`` waits for the processor to
+    take one, so the receive loop stops reading and the client is slowed
+    down instead of the server buffering every payload.
+    """
+    def __init__(self, maxsize=1, max_uploads=4):
+        self.maxsize = max(1, maxsize)
+        self.max_uploads = max(1, max_uploads)
+        self.items = deque()
+        self.dropped = 0
+        self.pending_uploads = 0
+        self._ready = asyncio.Event()
+        self._space = asyncio.Event()
+
+    async def put(self, request):
+        if request.is_webcam:
+            pending = [item for item in self.items if item.is_webcam]
+            while len(pending) >= self.maxsize:
+                # Eski kareyi at - işlenmeyi bekleyen en yeni kare kalsın
+                self.items.remove(pending.pop(0))
+                self.dropped += 1
+                connection_stats["dropped_frames"] += 1
+        else:
+            while self.pending_uploads >= self.max_uploads:
+                self._space.clear()
+                await self._space.wait()
+            self.pending_uploads += 1
+        self.items.append(request)
+        self._ready.set()
+
+    async def get(self):
+        while not self.items:
+            self._ready.clear()
+            await self._ready.wait()
+        request = self.items.popleft()
+        if not request.is_webcam:
+            self.pending_uploads -= 1
+            self._space.set()
+        return request
+
+async def process_frames(websocket, queue, connection_id, encoder):
+    """Consume a connection's queue and run each frame on the inference pool."""
+    loop = asyncio.get_running_loop()
+    # Bağlantıya özel durum - kareler sırayla işlendiği için kilit gerekmez
+    state = StreamState()
+    while True:
+        request = await queue.get()
+        frame_start = time.perf_counter()
+        try:
+            if MICRO_BATCHING:
+                response = await process_frame_batched(request, state)
+            else:
+                response = await loop.run_in_executor(
+                    inference_executor, process_frame, request, state
+                )
+            connection_stats["processed_frames"] += 1
+            if request.is_webcam:
+                state.last_detections = response["detections"]
+                if state.motion_gate is not None:
+                    connection_stats["gate_checked_frames"] += 1
+                    connection_stats["gate_skipped_frames"] += bool(response.get("skipped"))
+                    connection_stats["gate_ms_total"] += state.motion_gate.last_cost * 1000
+                    response["motion_gate"] = state.motion_gate.stats()
+        except Exception as e:
+            print(f"Processing error: {e}")
+            print(traceback.format_exc())  # Detaylı hata izini yazdır
+            response = {
+                "status": "error",
+                "message": str(e),
+                "detections": []
+            }
+        # Webcam yanıtları küçük kalsın - süreler yalnızca histogramlara yazılır
+        timings = response.pop("timings", None) if request.is_webcam else response.get("timings")
+        if timings is not None:
+            metrics.observe_timings(connection_id, timings)
+        response.update(request.echo_fields())
+        if request.is_webcam:
+            response["dropped_frames"] = queue.dropped
+        send_start = time.perf_counter()
+        # İstemci kompakt/delta kodlamayı seçtiyse ikili (MessagePack) veya kısa JSON
+        message = encoder.encode(response)
+        if message is None:
+            await websocket.send_json(response)
+        elif isinstance(message, bytes):
+            await websocket.send_bytes(message)
+        else:
+            await websocket.send_text(message)
+        now = time.perf_counter()
+        metrics.observe(connection_id, "send", now - send_start)
+        metrics.observe(connection_id, "total", now - frame_start)
+
+def run_model(images):
+    """Run the model on a list of images in one forward pass."""
+    return get_model()(images, verbose=VERBOSE_LOGGING, **NMS_SETTINGS)
+
+batch_scheduler = BatchScheduler(
+    run_model,
+    inference_executor,
+    max_batch_size=MAX_BATCH_SIZE,
+    max_wait_ms=MAX_BATCH_WAIT_MS,
+    latency_budget_ms=BATCH_LATENCY_BUDGET_MS,
+    max_inflight=INFERENCE_WORKERS,
+)
+
+async def process_frame_batched(request, state=None):
+    """Like ``process_frame`` but the model call goes through ``batch_scheduler``."""
+    loop = asyncio.get_running_loop()
+    prepared = await loop.run_in_executor(
+        inference_executor, prepare_frame, request, state
+    )
+    return await infer_prepared(prepared, state.tracker_for(request) if state else None)
+
+async def infer_prepared(prepared, tracker=None):
+    """Run the model on a ``PreparedFrame`` and post-process the results.
+
+    The model call goes through ``batch_scheduler`` when micro-batching is
+    enabled, otherwise straight to ``inference_executor``.
+    """
+    if prepared.response is not None:
+        return prepared.response
+    loop = asyncio.get_running_loop()
+
+    if MICRO_BATCHING:
+        start = time.perf_counter()
+        results = await batch_scheduler.submit([image for _, image in prepared.variants])
+        results_list = [(name, result) for (name, _), result in zip(prepared.variants, results)]
+        # Kuyrukta bekleme dahil, bu isteğin partide geçirdiği süre
+        total_ms = (time.perf_counter() - start) * 1000
+        prepared.timings["inference_ms"] = inference_ms_by_variant(
+            [name for name, _ in prepared.variants], results, total_ms
+        )
+        prepared.timings["inference_total_ms"] = total_ms
+        prepared.timings["batched"] = True
+        if prepared.native is not None:
+            tiles = plan_tiles(prepared, results_list)
+            if tiles:
+                start = time.perf_counter()
+                results = await batch_scheduler.submit(tile_planner.crop(prepared.native, tiles))
+                add_tile_results(prepared, results_list, tiles, results, start)
+    else:
+        results_list, inference_timings = await loop.run_in_executor(
+            inference_executor, run_batched_inference, get_model(), prepared.variants, BATCHED_INFERENCE
+        )
+        prepared.timings.update(inference_timings)
+        if prepared.native is not None:
+            await loop.run_in_executor(inference_executor, run_tile_pass, get_model(), prepared, results_list)
+    if VERBOSE_LOGGING:
+        print(f"Varyant süreleri (ms): {prepared.timings}")
+
+    return await loop.run_in_executor(
+        inference_executor, finish_frame, prepared, results_list, tracker
+    )
+
+def process_captured_frame(frame, timings, state):
+    """Resize a frame from a ``VideoStream`` and prepare it like a webcam frame."""
+    native = frame
+    frame = resize_frame(native, timings)
+    return frame, prepare_decoded(frame, True, state, timings, native=native)
+
+def encode_preview(frame):
+    """JPEG data URL of a processed frame, sent to stream viewers."""
+    ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, VIDEO_PREVIEW_QUALITY])
+    return "data:image/jpeg;base64," + base64.b64encode(buffer).decode() if ok else None
+
+def open_video_stream(stream_id, source):
+    """Create the shared ``VideoStream`` of a configured video source."""
+    state = StreamState()
+
+    async def process(frame, timings, frame_id, timestamp):
+        loop = asyncio.get_running_loop()
+        frame, prepared = await loop.run_in_executor(
+            inference_executor, process_captured_frame, frame, timings, state
+        )
+        response = await infer_prepared(prepared, state.tracker)
+        state.last_detections = response["detections"]
+        timings = response.pop("timings", None)
+        if timings is not None:
+            metrics.observe_timings(None, timings)
+        response["stream_id"] = stream_id
+        response["frame_id"] = frame_id
+        response["timestamp"] = int(timestamp * 1000)
+        if VIDEO_PREVIEW:
+            # Kare ve yanıt her izleyici için değil, yayın başına bir kez kodlanır
+            response["image"] = await loop.run_in_executor(inference_executor, encode_preview, frame)
+        return json.dumps(response)
+
+    def restart():
+        # Yeniden bağlanınca sahne değişmiş olabilir - ilk kare eski referansla karşılaştırılmaz
+        if state.motion_gate is not None:
+            state.motion_gate.reset()
+
+    return VideoStream(stream_id, source, process, on_restart=restart)
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await websocket.accept()
-    
+    connection_stats["active_connections"] += 1
+
+    # Kareler alınırken işleme ayrı bir görevde sürer; yavaş kareler alımı bloklamaz
+    queue = FrameQueue(FRAME_QUEUE_SIZE, UPLOAD_QUEUE_SIZE)
+    connection_id = metrics.open_connection()
+    # Sonuç kodlaması bağlantı başına; "encoding" ve "ack" mesajlarıyla yönetilir
+    encoder = ResultEncoder(lambda: ALL_CLASSES, totals=encoding_stats)
+    processor = asyncio.create_task(process_frames(websocket, queue, connection_id, encoder))
+
     try:
         while True:
             # Receive message
-            message = await websocket.receive_text()
-            
-            try:
-                # Try to parse as JSON first (for new format)
-                data = json.loads(message)
-                if isinstance(data, dict) and data.get('type') == 'detect':
-                    # Extract base64 image from JSON message
-                    encoded_data = data['image'].split(",")[1]
-                    is_webcam = data.get('mode') == 'webcam'  # Webcam modu kontrolü
-                else:
-                    # Old format - direct base64 string
-                    encoded_data = message.split(",")[1]
-                    is_webcam = False  # Eski format için varsayılan olarak webcam değil
-            except json.JSONDecodeError:
-                # Old format - direct base64 string
-                encoded_data = message.split(",")[1]
-                is_webcam = False  # JSON olmayan mesajlar için varsayılan olarak webcam değil
-            
+            # Metin (JSON/data URL) ve ikili kare mesajları aynı kuyruğa girer
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
             try:
-                # Decode image
-                nparr = np.frombuffer(base64.b64decode(encoded_data), np.uint8)
-                frame = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
-                
-                if frame is None:
-                    raise ValueError("Invalid image data")
-
-                # Görüntü boyutunu yazdır (debug için)
-                print(f"Alınan görüntü boyutu: {frame.shape}")
-                
-                # Görüntü boyutunu normalize et - 640x640 veya yakın bir değere ayarla
-                # Bu, model için daha iyi tespit sonuçları verebilir
-                max_dim = max(frame.shape[0], frame.shape[1])
-                if max_dim > 640:
-                    scale = 640 / max_dim
-                    new_width = int(frame.shape[1] * scale)
-                    new_height = int(frame.shape[0] * scale)
-                    frame = cv2.resize(frame, (new_width, new_height))
-                    print(f"Görüntü boyutu yeniden düzenlendi: {frame.shape}")
-
-                # Farklı işlenmiş görüntüler üzerinde tespit deneyin
-                yolo_model = get_model()
-                
-                print("Tespit işlemi başlıyor...")
-                
-                # Webcam modu için optimizasyon - sadece orijinal kareyi işle
-                if is_webcam:
-                    results_list = [("Orijinal", yolo_model(frame)[0])]
-                else:
-                    # Yüklenen görüntüler için tüm iyileştirmeleri kullan
-                    # Görüntü ön işleme - Daha iyi tespit için çeşitli iyileştirmeler
-                    # 1. Kontrast artırma - CLAHE yöntemi
-                    lab = cv2.cvtColor(frame, cv2.COLOR_BGR2LAB)
-                    l, a, b = cv2.split(lab)
-                    clahe = cv2.createCLAHE(clipLimit=3.0, tileGridSize=(8, 8))
-                    cl = clahe.apply(l)
-                    limg = cv2.merge((cl, a, b))
-                    enhanced_frame = cv2.cvtColor(limg, cv2.COLOR_LAB2BGR)
-                    
-                    # 2. Keskinlik artırma - Unsharp masking
-                    kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
-                    sharpened_frame = cv2.filter2D(enhanced_frame, -1, kernel)
-                    
-                    # 3. Parlaklık ve kontrast ayarları
-                    brightness_contrast_frame = frame.copy()
-                    alpha = 1.2  # Kontrast artırma (1.0-3.0)
-                    beta = 10    # Parlaklık artırma (0-100)
-                    brightness_contrast_frame = cv2.convertScaleAbs(frame, alpha=alpha, beta=beta)
-                    
-                    # 4. HSV renk uzayında yangın tespiti için özel ayarlar
-                    hsv_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-                    # Yangın tespiti için düşük ve yüksek HSV değerleri
-                    lower_red1 = np.array([0, 100, 100])
-                    upper_red1 = np.array([10, 255, 255])
-                    lower_red2 = np.array([160, 100, 100])
-                    upper_red2 = np.array([180, 255, 255])
-                    mask1 = cv2.inRange(hsv_frame, lower_red1, upper_red1)
-                    mask2 = cv2.inRange(hsv_frame, lower_red2, upper_red2)
-                    fire_mask = cv2.bitwise_or(mask1, mask2)
-                    fire_detected_frame = cv2.bitwise_and(frame, frame, mask=fire_mask)
-                    
-                    # Tüm işlenmiş görüntülerde tespit yap
-                    results_list = [
-                        ("Orijinal", yolo_model(frame)[0]),
-                        ("Geliştirilmiş", yolo_model(enhanced_frame)[0]),
-                        ("Keskinleştirilmiş", yolo_model(sharpened_frame)[0]),
-                        ("Parlaklık+Kontrast", yolo_model(brightness_contrast_frame)[0]),
-                        ("Yangın Maskeli", yolo_model(fire_detected_frame)[0])
-                    ]
-                
-                # Her tespit kümesi için sonuçları yazdır
-                for name, result in results_list:
-                    detections = []
-                    for box in result.boxes.data.tolist():
-                        if len(box) >= 6:
-                            _, _, _, _, conf, cls = box
-                            class_id = int(cls)
-                            class_name = result.names.get(class_id, "unknown")
-                            detections.append(class_name)
-                    print(f"{name} görüntüde tespit edilen nesneler ({len(result.boxes)}): {detections}")
-                
-                # Tüm sonuçları birleştir
-                all_detections = []
-                
-                # Process all detections from all image variations
-                for name, results_set in results_list:
-                    for r in results_set.boxes.data.tolist():
-                        if len(r) < 6:
-                            continue
-                            
-                        x1, y1, x2, y2, conf, cls = r
-                        class_id = int(cls)
-                        class_name = results_set.names.get(class_id, "unknown")
-                        
-                        # Sınıfa özgü güven eşiğini al
-                        class_conf_threshold = HAZARD_CLASSES.get(class_name, {}).get('conf_threshold', 
-                                              NON_HAZARD_CLASSES.get(class_name, {}).get('conf_threshold', 
-                                              float(yolo_model.conf)))
-                        
-                        # Koordinatları yumuşat
-                        box_id = f"{class_name}_{int(x1)}_{int(y1)}"  # Benzersiz ID oluştur
-                        current_coords = np.array([float(x1), float(y1), float(x2), float(y2)])
-                        box_smoother.update(box_id, current_coords)
-                        smoothed_coords = box_smoother.get_smoothed_coords(box_id)
-                        
-                        if smoothed_coords is not None:
-                            x1, y1, x2, y2 = smoothed_coords
-                        
-                        # Check if this detection overlaps with any existing one
-                        is_duplicate = False
-                        for existing in all_detections:
-                            if existing["class"] == class_name and calculate_iou(
-                                [float(x1), float(y1), float(x2), float(y2)], 
-                                existing["box"]
-                            ) > 0.3:
-                                is_duplicate = True
-                                # Keep the higher confidence one
-                                if float(conf) > existing["confidence"]:
-                                    existing["confidence"] = float(conf)
-                                    existing["box"] = [float(x1), float(y1), float(x2), float(y2)]
-                                break
-                        
-                        # Add if not duplicate and meets confidence threshold
-                        if not is_duplicate and conf >= class_conf_threshold:
-                            detection = {
-                                "box": [float(x1), float(y1), float(x2), float(y2)],
-                                "confidence": float(conf),
-                                "class": class_name,
-                                "in_danger": class_name in HAZARD_CLASSES,
-                                "danger_level": HAZARD_CLASSES.get(class_name, {}).get('level', None),
-                                "safety_equipment": class_name in ['Kaskli', 'Yelekli'],
-                                "source": name
-                            }
-                            all_detections.append(detection)
-                
-                # Temizlik işlemi - artık görünmeyen nesnelerin geçmişini sil
-                current_ids = [f"{d['class']}_{int(d['box'][0])}_{int(d['box'][1])}" for d in all_detections]
-                box_smoother.clean_old_entries(current_ids)
-                
-                # Gruplandırma işlemi
-                human_boxes = [d for d in all_detections if d["class"] in HUMAN_CLASSES]
-                hazard_boxes = [d for d in all_detections if d["class"] in HAZARD_CLASSES]
-                
-                # Filtreleme: Çakışan insan kutularını birleştir veya en önemlisini seç
-                filtered_humans = []
-                if human_boxes:
-                    # Önceliğe göre sırala
-                    human_boxes.sort(key=lambda x: HUMAN_PRIORITY.get(x["class"], 999))
-                    
-                    for human in human_boxes:
-                        # Daha önce eklenen kutularla çakışıyor mu kontrol et
-                        should_add = True
-                        for existing in filtered_humans:
-                            if calculate_iou(human["box"], existing["box"]) > 0.3:  # %30'dan fazla çakışma varsa
-                                should_add = False
-                                break
-                        
-                        if should_add:
-                            # Kasksız ve Yeleksiz kişileri tehlike olarak işaretle
-                            if human["class"] in ["Kasksiz", "Yeleksiz"]:
-                                human["in_danger"] = True
-                                human["danger_level"] = "high" if human["class"] == "Kasksiz" else "medium"
-                                human["danger_source"] = "Güvenlik ekipmanı eksikliği"
-                            
-                            filtered_humans.append(human)
-                
-                # Tehlike durumlarını kontrol et
-                for human in filtered_humans:
-                    # Tüm tehlikeleri eşit öncelikle kontrol et
-                    for hazard in hazard_boxes:
-                        is_danger, danger_level = check_danger(
-                            human["box"], 
-                            hazard["box"],
-                            hazard["class"]
-                        )
-                        if is_danger:
-                            human["in_danger"] = True
-                            human["danger_level"] = danger_level
-                            human["danger_source"] = hazard["class"]
-                            print(f"İnsan {hazard['class']} tehlikesinde! Mesafe: {calculate_distance(human['box'], hazard['box'])}")
-                            break  # İlk tespit edilen tehlike durumunda dur
-
-                # Tehlikeli olmayan durumları ve tehlike kaynaklarını da dahil et
-                final_detections = filtered_humans + [h for h in all_detections if h["class"] not in HUMAN_CLASSES]
-                
-                # Send results back to client
-                await websocket.send_json({
-                    "status": "success",
-                    "detections": final_detections,
-                    "message": f"Detected {len(final_detections)} objects"
-                })
-                print(f"Toplam {len(final_detections)} nesne tespit edildi ve istemciye gönderildi.")
-
-            except Exception as e:
-                import traceback
-                print(f"Processing error: {e}")
-                print(traceback.format_exc())  # Detaylı hata izini yazdır
+                request = parse_message(message)
+            except (ValueError, KeyError, IndexError, TypeError) as e:
+                # Bozuk mesaj yalnızca kendisini düşürür; bağlantı ve kuyruktaki kareler sürer
+                print(f"Message parse error: {e}")
                 await websocket.send_json({
                     "status": "error",
                     "message": str(e),
                     "detections": []
                 })
+                continue
+            if isinstance(request, ControlMessage):
+                if request.kind == "encoding":
+                    await websocket.send_json(encoder.configure(request.data))
+                else:
+                    encoder.ack(request.data.get("seq"))
+                continue
+            await queue.put(request)
 
+    except WebSocketDisconnect:
+        print("WebSocket bağlantısı kapandı")
     except Exception as e:
-        import traceback
         print(f"WebSocket error: {e}")
         print(traceback.format_exc())  # Print detailed error trace
         try:
             await websocket.close(code=1000)
         except Exception as close_error:
             print(f"Error during WebSocket close: {close_error}")
+    finally:
+        processor.cancel()
+        metrics.close_connection(connection_id)
+        connection_stats["active_connections"] -= 1
+
+video_streams = {
+    stream_id.strip(): open_video_stream(stream_id.strip(), source.strip())
+    for stream_id, source in VIDEO_SOURCES.items()
+}
+
+@app.websocket("/streams/{stream_id}")
+async def video_stream_endpoint(websocket: WebSocket, stream_id: str):
+    stream = video_streams.get(stream_id)
+    await websocket.accept()
+    if stream is None:
+        await websocket.close(code=4404)
+        return
+    connection_stats["active_connections"] += 1
+    subscription = stream.subscribe()
+
+    async def forward():
+        while True:
+            await websocket.send_text(await subscription.get())
+
+    sender = asyncio.create_task(forward())
+    try:
+        # İzleyiciden mesaj beklenmez; yalnızca bağlantının kapanması izlenir
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+    finally:
+        sender.cancel()
+        stream.unsubscribe(subscription)
+        connection_stats["active_connections"] -= 1
+
+@app.get("/streams")
+def read_streams():
+    return {stream_id: stream.stats() for stream_id, stream in video_streams.items()}
+
+@app.on_event("shutdown")
+def stop_video_streams():
+    for stream in video_streams.values():
+        stream.stop()
 
 @app.get("/")
 def read_root():
-    return {"status": "AI Safety Monitoring System Backend is running"} 
\ No newline at end of file
+    content = {
+        "status": "AI Safety Monitoring System Backend is running",
+        "ready": startup_status["ready"],
+        "startup": startup_status,
+    }
+    # Isıtma bitene kadar 503: yük dengeleyici/yoklayıcılar trafiği henüz yönlendirmez
+    return JSONResponse(content, status_code=200 if startup_status["ready"] else 503)
+
+@app.get("/stats")
+def read_stats():
+    stats = dict(connection_stats, inference_workers=INFERENCE_WORKERS, frame_queue_size=FRAME_QUEUE_SIZE,
+                 upload_queue_size=UPLOAD_QUEUE_SIZE,
+                 inference_backend=INFERENCE_BACKEND, inference_precision=INFERENCE_PRECISION)
+    if MICRO_BATCHING:
+        stats["scheduler"] = batch_scheduler.stats()
+    if result_cache is not None:
+        stats["result_cache"] = result_cache.stats()
+    stats["preprocess_buffers"] = preprocessor.stats()
+    stats["upload_quality"] = UPLOAD_QUALITY
+    stats["variant_stats"] = {
+        name: dict(counts, unique_per_frame=counts["unique"] / counts["frames"] if counts["frames"] else 0.0)
+        for name, counts in variant_stats.items()
+    }
+    checked = connection_stats["gate_checked_frames"]
+    stats["gate_skip_ratio"] = connection_stats["gate_skipped_frames"] / checked if checked else 0.0
+    stats["gate_ms_avg"] = connection_stats["gate_ms_total"] / checked if checked else 0.0
+    encoded = encoding_stats["full_messages"] + encoding_stats["delta_messages"]
+    stats["result_encoding"] = dict(encoding_stats,
+                                    delta_ratio=encoding_stats["delta_messages"] / encoded if encoded else 0.0)
+    return stats
+
+@app.get("/metrics")
+def read_metrics():
+    """Per-stage latency histograms in the Prometheus text format."""
+    gauges = {"active_connections": connection_stats["active_connections"]}
+    counters = {
+        "processed_frames_total": connection_stats["processed_frames"],
+        "dropped_frames_total": connection_stats["dropped_frames"],
+        "gate_skipped_frames_total": connection_stats["gate_skipped_frames"],
+    }
+    return PlainTextResponse(metrics.render(gauges, counters), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,155 @@
+import bisect
+import itertools
+import threading
+
+# Aşama süreleri için histogram sınırları (saniye)
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Yanıttaki ``timings`` anahtarları -> histogram aşama adı
+STAGE_KEYS = {
+    "decode_ms": "decode",
+    "resize_ms": "resize",
+    "gate_ms": "motion_gate",
+    "cache_lookup_ms": "cache_lookup",
+    "preprocess_ms": "preprocess",
+    "inference_ms": "inference",
+    "inference_total_ms": "inference_total",
+    "tile_inference_ms": "tile_inference",
+    "postprocess_ms": "postprocess",
+}
+
+
+def iter_timings(timings):
+    """``(stage, seconds, variant)`` observations of a response ``timings`` dict (values in ms)."""
+    for key, stage in STAGE_KEYS.items():
+        value = timings.get(key)
+        if isinstance(value, dict):
+            for variant, ms in value.items():
+                yield stage, ms / 1000, variant
+        elif value is not None:
+            yield stage, value / 1000, ""
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus layout."""
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # son eleman: +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def cumulative(self):
+        return list(itertools.accumulate(self.counts))
+
+
+class StageMetrics:
+    """Latency histograms of one scope (a connection or the whole server).
+
+    Histograms are keyed by ``(stage, variant)``; ``variant`` is empty for
+    stages that do not run per image variant.
+    """
+
+    def __init__(self):
+        self.histograms = {}
+
+    def observe(self, stage, seconds, variant=""):
+        histogram = self.histograms.get((stage, variant))
+        if histogram is None:
+            histogram = self.histograms[(stage, variant)] = Histogram()
+        histogram.observe(seconds)
+
+    def observe_timings(self, timings):
+        """Record a response ``timings`` dict (values in ms, nested per variant)."""
+        for stage, seconds, variant in iter_timings(timings):
+            self.observe(stage, seconds, variant)
+
+
+class MetricsRegistry:
+    """Global and per-connection stage histograms, rendered for ``/metrics``.
+
+    Every observation goes to the global scope and to the connection's own
+    scope; a connection's histograms are dropped when it disconnects.
+    ``listeners`` are called with ``(connection_id, stage, seconds, variant)``
+    for every observation, e.g. by the offline benchmark to keep raw samples.
+    """
+
+    def __init__(self):
+        self.total = StageMetrics()
+        self.connections = {}
+        self.listeners = []
+        self._ids = itertools.count(1)
+        # /metrics başka bir iş parçacığında okunur
+        self._lock = threading.Lock()
+
+    def open_connection(self):
+        connection_id = next(self._ids)
+        with self._lock:
+            self.connections[connection_id] = StageMetrics()
+        return connection_id
+
+    def close_connection(self, connection_id):
+        with self._lock:
+            self.connections.pop(connection_id, None)
+
+    def observe(self, connection_id, stage, seconds, variant=""):
+        with self._lock:
+            self.total.observe(stage, seconds, variant)
+            connection = self.connections.get(connection_id)
+            if connection is not None:
+                connection.observe(stage, seconds, variant)
+            for listener in self.listeners:
+                listener(connection_id, stage, seconds, variant)
+
+    def observe_timings(self, connection_id, timings):
+        with self._lock:
+            connection = self.connections.get(connection_id)
+            for stage, seconds, variant in iter_timings(timings):
+                self.total.observe(stage, seconds, variant)
+                if connection is not None:
+                    connection.observe(stage, seconds, variant)
+                for listener in self.listeners:
+                    listener(connection_id, stage, seconds, variant)
+
+    def render(self, gauges=None, counters=None):
+        """Prometheus text exposition of all histograms, ``gauges`` and ``counters``."""
+        lines = []
+        for kind, values in (("gauge", gauges), ("counter", counters)):
+            for name, value in (values or {}).items():
+                lines.append(f"# TYPE {name} {kind}")
+                lines.append(f"{name} {value}")
+        with self._lock:
+            lines.append("# HELP frame_stage_seconds Per-stage frame processing latency.")
+            lines.append("# TYPE frame_stage_seconds histogram")
+            _render_scope(lines, "frame_stage_seconds", self.total, {})
+            lines.append("# HELP connection_frame_stage_seconds Per-stage latency of each open connection.")
+            lines.append("# TYPE connection_frame_stage_seconds histogram")
+            for connection_id, scope in self.connections.items():
+                _render_scope(lines, "connection_frame_stage_seconds", scope,
+                              {"connection": str(connection_id)})
+        return "\n".join(lines) + "\n"
+
+
+def _label_value(value):
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(labels):
+    return "{" + ",".join(f'{key}="{_label_value(value)}"' for key, value in labels.items()) + "}"
+
+
+def _render_scope(lines, name, scope, labels):
+    for (stage, variant), histogram in sorted(scope.histograms.items()):
+        series = dict(labels, stage=stage)
+        if variant:
+            series["variant"] = variant
+        for bound, count in zip(histogram.buckets + ("+Inf",), histogram.cumulative()):
+            lines.append(f"{name}_bucket{_labels(dict(series, le=str(bound)))} {count}")
+        lines.append(f"{name}_sum{_labels(series)} {histogram.sum}")
+        lines.append(f"{name}_count{_labels(series)} {histogram.count}")
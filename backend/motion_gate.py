@@ -0,0 +1,89 @@
+import time
+
+import cv2
+
+
+class MotionGate:
+    """Cheap per-stream check that decides whether a frame needs the model.
+
+    The frame is shrunk to ``size`` and converted to grayscale, then compared
+    with the thumbnail of the last frame that went through inference. The
+    thumbnail is split into a ``grid`` of regions and the largest mean
+    absolute difference of a region is the change score, so a small moving
+    worker is not averaged away by a static background. Below
+    ``threshold`` the frame is skipped, but inference is forced at least
+    every ``max_skip_frames`` frames or ``max_skip_seconds`` seconds.
+    """
+
+    def __init__(self, threshold=6.0, size=(64, 48), grid=(4, 4),
+                 max_skip_frames=30, max_skip_seconds=1.0):
+        self.threshold = threshold
+        self.size = size
+        self.grid = grid
+        self.max_skip_frames = max_skip_frames
+        self.max_skip_seconds = max_skip_seconds
+
+        self.reference = None
+        self.skipped_in_row = 0
+        self.last_inference = 0.0
+        self.last_score = None
+        self.last_cost = 0.0
+
+        self.checked = 0
+        self.skipped = 0
+        self.gate_seconds = 0.0
+
+    def _thumbnail(self, frame):
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA)
+        return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+    def change_score(self, thumbnail):
+        """Largest per-region mean absolute difference to the reference."""
+        diff = cv2.absdiff(thumbnail, self.reference)
+        rows, cols = self.grid
+        height, width = diff.shape
+        regions = diff[:height - height % rows, :width - width % cols].reshape(
+            rows, height // rows, cols, width // cols)
+        return float(regions.mean(axis=(1, 3)).max())
+
+    def should_infer(self, frame, now=None):
+        """Return ``True`` if ``frame`` must go through the model."""
+        start = time.perf_counter()
+        now = time.monotonic() if now is None else now
+        thumbnail = self._thumbnail(frame)
+        self.checked += 1
+
+        if self.reference is None or self.reference.shape != thumbnail.shape:
+            infer = True
+            self.last_score = None
+        else:
+            self.last_score = self.change_score(thumbnail)
+            infer = (self.last_score >= self.threshold
+                     or self.skipped_in_row >= self.max_skip_frames
+                     or now - self.last_inference >= self.max_skip_seconds)
+
+        if infer:
+            # Referans yalnızca modelden geçen karelerde güncellenir; yavaş
+            # değişimler birikerek eşiği aşar
+            self.reference = thumbnail
+            self.skipped_in_row = 0
+            self.last_inference = now
+        else:
+            self.skipped += 1
+            self.skipped_in_row += 1
+        self.last_cost = time.perf_counter() - start
+        self.gate_seconds += self.last_cost
+        return infer
+
+    def reset(self):
+        """Force the next frame through the model."""
+        self.reference = None
+
+    def stats(self):
+        return {
+            "checked": self.checked,
+            "skipped": self.skipped,
+            "skip_ratio": self.skipped / self.checked if self.checked else 0.0,
+            "gate_ms_avg": self.gate_seconds / self.checked * 1000 if self.checked else 0.0,
+            "last_score": self.last_score,
+        }
@@ -0,0 +1,331 @@
+import numpy as np
+
+from hazard_grid import HazardGrid
+
+# Aynı sınıftaki kutuların ve insan kutularının birleştirilme eşiği
+DUPLICATE_IOU_THRESHOLD = 0.3
+# Menzildeki tehlikelerin sıralaması: önce seviye, sonra mesafe, sonra tespit sırası
+LEVEL_RANK = {"high": 0, "medium": 1, "low": 2}
+# Tüm mesafe eşikleri çok küçükse ızgara hücreleri bundan küçük olmaz
+MIN_GRID_CELL_SIZE = 32.0
+
+
+def _iou(x1a, y1a, x2a, y2a, x1b, y1b, x2b, y2b):
+    """Element-wise IoU, mirroring ``calculate_iou`` (0 for disjoint boxes)."""
+    x1 = np.maximum(x1a, x1b)
+    y1 = np.maximum(y1a, y1b)
+    x2 = np.minimum(x2a, x2b)
+    y2 = np.minimum(y2a, y2b)
+
+    intersection = (x2 - x1) * (y2 - y1)
+    union = (x2a - x1a) * (y2a - y1a) + (x2b - x1b) * (y2b - y1b) - intersection
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        iou = intersection / union
+    iou[(x2 < x1) | (y2 < y1)] = 0.0
+    # Alanı sıfır olan iki kutu: çakışma olarak sayılmaz
+    iou[~np.isfinite(iou)] = 0.0
+    return iou
+
+
+def pairwise_iou(boxes_a, boxes_b):
+    """IoU matrix between two ``(n, 4)`` arrays of ``[x1, y1, x2, y2]`` boxes."""
+    a = boxes_a[:, None, :]
+    b = boxes_b[None, :, :]
+    return _iou(a[..., 0], a[..., 1], a[..., 2], a[..., 3],
+                b[..., 0], b[..., 1], b[..., 2], b[..., 3])
+
+
+def gap_distance(boxes_a, boxes_b):
+    """Edge-to-edge distance of paired ``[..., 4]`` box arrays (0 when touching or overlapping).
+
+    The arrays broadcast, so ``boxes_a[:, None]`` and ``boxes_b[None]`` give
+    the full distance matrix.
+    """
+    dx = np.maximum(0.0, np.maximum(boxes_b[..., 0] - boxes_a[..., 2], boxes_a[..., 0] - boxes_b[..., 2]))
+    dy = np.maximum(0.0, np.maximum(boxes_b[..., 1] - boxes_a[..., 3], boxes_a[..., 1] - boxes_b[..., 3]))
+    return np.sqrt(dx * dx + dy * dy)
+
+
+def boxes_overlap(boxes_a, boxes_b):
+    """Whether paired (broadcast) boxes have a strictly positive intersection."""
+    return ((np.maximum(boxes_a[..., 0], boxes_b[..., 0]) < np.minimum(boxes_a[..., 2], boxes_b[..., 2]))
+            & (np.maximum(boxes_a[..., 1], boxes_b[..., 1]) < np.minimum(boxes_a[..., 3], boxes_b[..., 3])))
+
+
+def earlier_similar(boxes, groups=None, threshold=DUPLICATE_IOU_THRESHOLD):
+    """For each box, the indices of earlier boxes with IoU above ``threshold``.
+
+    With ``groups`` only boxes of the same group (class) are compared: the
+    candidate pairs are generated per group and their IoU is computed in one
+    vectorized pass instead of building a full ``n x n`` matrix.
+    """
+    count = len(boxes)
+    if groups is None:
+        groups = np.zeros(count, dtype=np.intp)
+    order = np.argsort(groups, kind="stable")
+    _, starts, sizes = np.unique(groups[order], return_index=True, return_counts=True)
+
+    # Sıralı dizide her elemanın grubunun başlangıcı ve boyutu
+    member_start = np.repeat(starts, sizes)
+    member_size = np.repeat(sizes, sizes)
+    offsets = np.cumsum(member_size) - member_size
+    positions = np.arange(member_size.sum()) - np.repeat(offsets, member_size)
+    rows = np.repeat(order, member_size)
+    cols = order[np.repeat(member_start, member_size) + positions]
+    earlier = cols < rows
+    rows, cols = rows[earlier], cols[earlier]
+
+    a = boxes[rows]
+    b = boxes[cols]
+    keep = _iou(a[:, 0], a[:, 1], a[:, 2], a[:, 3], b[:, 0], b[:, 1], b[:, 2], b[:, 3]) > threshold
+
+    neighbours = [[] for _ in range(count)]
+    for row, col in zip(rows[keep].tolist(), cols[keep].tolist()):
+        neighbours[row].append(col)
+    return neighbours
+
+
+class DetectionPostProcessor:
+    """Batched NumPy version of the duplicate merge, human filter and danger check.
+
+    The per-class settings are the ``HAZARD_CLASSES``/``NON_HAZARD_CLASSES``
+    dicts from ``main``; thresholds are turned into per-detection arrays so
+    every pairwise test is a single matrix operation. The greedy, order
+    dependent parts (first match wins) keep the original iteration order, so
+    the output is identical to the pure-Python loops.
+    """
+
+    def __init__(self, hazard_classes, non_hazard_classes, human_classes, human_priority):
+        self.hazard_classes = hazard_classes
+        self.non_hazard_classes = non_hazard_classes
+        self.human_classes = human_classes
+        self.human_priority = human_priority
+        # Izgara hücresi en büyük mesafe eşiği kadar: menzildeki her tehlike komşu hücrelerdedir
+        self.max_distance = max((h['distance_threshold'] for h in hazard_classes.values()), default=0)
+        self.grid_cell_size = max(float(self.max_distance), MIN_GRID_CELL_SIZE)
+
+    def conf_threshold(self, class_name, default_conf):
+        return self.hazard_classes.get(class_name, {}).get(
+            'conf_threshold',
+            self.non_hazard_classes.get(class_name, {}).get('conf_threshold', default_conf))
+
+    def merge(self, raw_detections, default_conf):
+        """Merge ``(box, conf, class_name, source)`` detections from all variants.
+
+        A detection is a duplicate of the first kept detection of the same
+        class with IoU above ``DUPLICATE_IOU_THRESHOLD``; the kept one takes
+        the higher confidence and its box. Non-duplicates are kept when they
+        pass their class confidence threshold.
+        """
+        if not raw_detections:
+            return []
+
+        box_lists = [list(d[0]) for d in raw_detections]
+        boxes = np.array(box_lists, dtype=np.float64)
+        confs = [float(d[1]) for d in raw_detections]
+        class_names = [d[2] for d in raw_detections]
+        class_index = {name: i for i, name in enumerate(dict.fromkeys(class_names))}
+        class_ids = np.array([class_index[name] for name in class_names])
+        thresholds = np.array([self.conf_threshold(name, default_conf) for name in class_index])
+        passes = (np.array(confs) >= thresholds[class_ids]).tolist()
+
+        # Yalnızca aynı sınıftaki kutular birbirinin kopyası olabilir; her tespit
+        # için kendisinden önce gelen benzer tespitlerin listesi
+        earlier = earlier_similar(boxes, class_ids)
+
+        # Şu an bir tutulan tespitin kutusunu veren ham tespit -> o tespitin sırası
+        slot_of_source = {}
+        source_of_slot = []
+        merged = []
+        for i, (_, conf, class_name, name) in enumerate(raw_detections):
+            slots = [slot_of_source[j] for j in earlier[i] if j in slot_of_source]
+            if slots:
+                # İlk eklenen (en düşük sıralı) eşleşme kazanır
+                slot = min(slots)
+                existing = merged[slot]
+                # Keep the higher confidence one
+                if confs[i] > existing["confidence"]:
+                    existing["confidence"] = confs[i]
+                    existing["box"] = box_lists[i]
+                    del slot_of_source[source_of_slot[slot]]
+                    slot_of_source[i] = slot
+                    source_of_slot[slot] = i
+                continue
+
+            # Add if not duplicate and meets confidence threshold
+            if passes[i]:
+                slot_of_source[i] = len(merged)
+                source_of_slot.append(i)
+                merged.append({
+                    "box": box_lists[i],
+                    "confidence": confs[i],
+                    "class": class_name,
+                    "in_danger": class_name in self.hazard_classes,
+                    "danger_level": self.hazard_classes.get(class_name, {}).get('level', None),
+                    "safety_equipment": class_name in ['Kaskli', 'Yelekli'],
+                    "source": name
+                })
+        return merged
+
+    def contributors(self, merged, raw_detections, default_conf):
+        """For each merged detection, the set of variants that found it.
+
+        A variant found a detection when one of its raw detections of the
+        same class passes the class confidence threshold and overlaps the
+        merged box with IoU above ``DUPLICATE_IOU_THRESHOLD``.
+        """
+        if not merged:
+            return []
+        raw = [d for d in raw_detections if float(d[1]) >= self.conf_threshold(d[2], default_conf)]
+        if not raw:
+            return [{d["source"]} for d in merged]
+        iou = pairwise_iou(np.array([d["box"] for d in merged], dtype=np.float64),
+                           np.array([list(d[0]) for d in raw], dtype=np.float64))
+        same_class = np.array([d["class"] for d in merged])[:, None] == np.array([d[2] for d in raw])[None, :]
+        found = (iou > DUPLICATE_IOU_THRESHOLD) & same_class
+        sources = [d[3] for d in raw]
+        # Birleştirilmiş tespitin kendi kaynağı her zaman dahildir
+        return [{d["source"]} | {sources[j] for j in np.flatnonzero(row).tolist()}
+                for d, row in zip(merged, found)]
+
+    def filter_humans(self, all_detections):
+        """Keep one human box per person, preferring the most important class."""
+        human_boxes = [d for d in all_detections if d["class"] in self.human_classes]
+        if not human_boxes:
+            return []
+        # Önceliğe göre sırala
+        human_boxes.sort(key=lambda x: self.human_priority.get(x["class"], 999))
+
+        boxes = np.array([h["box"] for h in human_boxes], dtype=np.float64)
+        earlier = earlier_similar(boxes)
+        kept = set()
+        filtered_humans = []
+        for i, human in enumerate(human_boxes):
+            # Daha önce eklenen kutularla %30'dan fazla çakışıyor mu kontrol et
+            if any(j in kept for j in earlier[i]):
+                continue
+            # Kasksız ve Yeleksiz kişileri tehlike olarak işaretle
+            if human["class"] in ["Kasksiz", "Yeleksiz"]:
+                human["in_danger"] = True
+                human["danger_level"] = "high" if human["class"] == "Kasksiz" else "medium"
+                human["danger_source"] = "Güvenlik ekipmanı eksikliği"
+            kept.add(i)
+            filtered_humans.append(human)
+        return filtered_humans
+
+    def hazard_grid(self, hazards, tracker=None):
+        """``HazardGrid`` holding ``hazards``; kept on the ``tracker`` across frames.
+
+        Tracked hazards are keyed by track ID, so a static one is not
+        re-bucketed; untracked hazards only live for the current frame.
+        """
+        if tracker is None:
+            grid = HazardGrid(self.grid_cell_size)
+        else:
+            if tracker.hazard_grid is None:
+                tracker.hazard_grid = HazardGrid(self.grid_cell_size)
+            grid = tracker.hazard_grid
+        grid.sync((hazard.get("track_id", ("frame", i)), hazard["box"], i) for i, hazard in enumerate(hazards))
+        return grid
+
+    def hazards_in_range(self, human_boxes, hazards, grid):
+        """For each human box, all hazards overlapping it or within their distance threshold.
+
+        Every human only gets the hazards of the grid cells around it as
+        candidates; the candidate pairs are then tested in one vectorized
+        pass. Returns per human a list of ``(index, distance)`` pairs ranked
+        by level, distance and detection order.
+        """
+        pair_humans = []
+        pair_hazards = []
+        for row, box in enumerate(human_boxes.tolist()):
+            indices = grid.query(box, self.max_distance)
+            pair_humans.extend([row] * len(indices))
+            pair_hazards.extend(indices)
+        found = [[] for _ in range(len(human_boxes))]
+        if not pair_hazards:
+            return found
+
+        hazard_boxes = np.array([h["box"] for h in hazards], dtype=np.float64)
+        thresholds = np.array([self.hazard_classes[h["class"]]['distance_threshold'] for h in hazards])
+        ranks = np.array([LEVEL_RANK.get(self.hazard_classes[h["class"]]['level'], len(LEVEL_RANK))
+                          for h in hazards])
+        rows = np.array(pair_humans)
+        cols = np.array(pair_hazards)
+        a = human_boxes[rows]
+        b = hazard_boxes[cols]
+        distances = gap_distance(a, b)
+        keep = np.flatnonzero(boxes_overlap(a, b) | (distances < thresholds[cols]))
+        rows, cols, distances = rows[keep], cols[keep], distances[keep]
+        order = np.lexsort((cols, distances, ranks[cols], rows))
+        for row, col, distance in zip(rows[order].tolist(), cols[order].tolist(), distances[order].tolist()):
+            found[row].append((col, distance))
+        return found
+
+    def assign_dangers(self, filtered_humans, all_detections, on_danger=None, tracker=None):
+        """Mark each human with every hazard in range, the highest-level first.
+
+        With a ``tracker`` the check only runs for humans whose track moved
+        since its last check or is new, or when the hazards changed; the others reuse the result
+        cached on their track.
+        """
+        if not filtered_humans:
+            return
+        hazards = [d for d in all_detections if d["class"] in self.hazard_classes]
+
+        check = np.arange(len(filtered_humans))
+        if tracker is not None:
+            changed = tracker.hazards_changed([h.get("track_id") for h in hazards])
+            rows, stale = tracker.stale_rows([h.get("track_id") for h in filtered_humans], changed)
+            for i in np.flatnonzero(~stale).tolist():
+                cached = tracker.cached_danger(rows[i])
+                if cached is not None:
+                    self._mark(filtered_humans[i], *cached)
+            check = np.flatnonzero(stale)
+
+        found = {}
+        if hazards and len(check):
+            grid = self.hazard_grid(hazards, tracker)
+            human_boxes = np.array([filtered_humans[i]["box"] for i in check], dtype=np.float64)
+            found = dict(zip(check.tolist(), self.hazards_in_range(human_boxes, hazards, grid)))
+
+        for i in check.tolist():
+            human = filtered_humans[i]
+            in_range = [self._describe(hazards[index], distance) for index, distance in found.get(i, [])]
+            if in_range:
+                top = hazards[found[i][0][0]]
+                level = self.hazard_classes[top["class"]]['level']
+                self._mark(human, level, top["class"], in_range)
+                if on_danger is not None:
+                    on_danger(human, top, found[i][0][1])
+            if tracker is not None and rows[i] >= 0:
+                if in_range:
+                    tracker.store_danger(rows[i], level, top["class"], in_range)
+                else:
+                    tracker.store_danger(rows[i], None, None)
+
+    def _describe(self, hazard, distance):
+        description = {
+            "class": hazard["class"],
+            "level": self.hazard_classes[hazard["class"]]['level'],
+            "distance": round(distance, 1),
+        }
+        if "track_id" in hazard:
+            description["track_id"] = hazard["track_id"]
+        return description
+
+    @staticmethod
+    def _mark(human, level, source, in_range=None):
+        human["in_danger"] = True
+        human["danger_level"] = level
+        human["danger_source"] = source
+        if in_range:
+            human["hazards_in_range"] = in_range
+
+    def assess(self, all_detections, on_danger=None, tracker=None):
+        """Filter humans and check dangers on the merged detections."""
+        filtered_humans = self.filter_humans(all_detections)
+        self.assign_dangers(filtered_humans, all_detections, on_danger, tracker)
+        # Tehlikeli olmayan durumları ve tehlike kaynaklarını da dahil et
+        return filtered_humans + [h for h in all_detections if h["class"] not in self.human_classes]
@@ -0,0 +1,208 @@
+import threading
+import time
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+
+VARIANT_NAMES = ("Orijinal", "Geliştirilmiş", "Keskinleştirilmiş", "Parlaklık+Kontrast", "Yangın Maskeli")
+# Yükleme kalite modları: fast yalnızca orijinal, balanced seçili varyantlar, full hepsi
+QUALITY_MODES = ("fast", "balanced", "full")
+
+# Varyant ayarları - referans uygulama ile motor aynı değerleri kullanır
+CLAHE_CLIP_LIMIT = 3.0
+CLAHE_TILE_GRID = (8, 8)
+SHARPEN_KERNEL = np.array([[-1, -1, -1], [-1, 9, -1], [-1, -1, -1]])
+BRIGHTNESS_ALPHA = 1.2  # Kontrast artırma (1.0-3.0)
+BRIGHTNESS_BETA = 10    # Parlaklık artırma (0-100)
+# Yangın tespiti için düşük ve yüksek HSV değerleri (kırmızı tonu 0'da sarar)
+FIRE_HSV_RANGES = (
+    (np.array([0, 100, 100]), np.array([10, 255, 255])),
+    (np.array([160, 100, 100]), np.array([180, 255, 255])),
+)
+
+
+def build_variants_reference(frame):
+    """Original per-call implementation, kept as the parity and benchmark reference."""
+    timings = {"preprocess_ms": {"Orijinal": 0.0}}
+
+    # 1. Kontrast artırma - CLAHE yöntemi
+    start = time.perf_counter()
+    lab = cv2.cvtColor(frame, cv2.COLOR_BGR2LAB)
+    l, a, b = cv2.split(lab)
+    clahe = cv2.createCLAHE(clipLimit=CLAHE_CLIP_LIMIT, tileGridSize=CLAHE_TILE_GRID)
+    cl = clahe.apply(l)
+    limg = cv2.merge((cl, a, b))
+    enhanced_frame = cv2.cvtColor(limg, cv2.COLOR_LAB2BGR)
+    timings["preprocess_ms"]["Geliştirilmiş"] = (time.perf_counter() - start) * 1000
+
+    # 2. Keskinlik artırma - Unsharp masking
+    start = time.perf_counter()
+    kernel = np.array([[-1,-1,-1], [-1,9,-1], [-1,-1,-1]])
+    sharpened_frame = cv2.filter2D(enhanced_frame, -1, kernel)
+    timings["preprocess_ms"]["Keskinleştirilmiş"] = (time.perf_counter() - start) * 1000
+
+    # 3. Parlaklık ve kontrast ayarları
+    start = time.perf_counter()
+    brightness_contrast_frame = frame.copy()
+    brightness_contrast_frame = cv2.convertScaleAbs(frame, alpha=BRIGHTNESS_ALPHA, beta=BRIGHTNESS_BETA)
+    timings["preprocess_ms"]["Parlaklık+Kontrast"] = (time.perf_counter() - start) * 1000
+
+    # 4. HSV renk uzayında yangın tespiti için özel ayarlar
+    start = time.perf_counter()
+    hsv_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
+    (lower_red1, upper_red1), (lower_red2, upper_red2) = FIRE_HSV_RANGES
+    mask1 = cv2.inRange(hsv_frame, lower_red1, upper_red1)
+    mask2 = cv2.inRange(hsv_frame, lower_red2, upper_red2)
+    fire_mask = cv2.bitwise_or(mask1, mask2)
+    fire_detected_frame = cv2.bitwise_and(frame, frame, mask=fire_mask)
+    timings["preprocess_ms"]["Yangın Maskeli"] = (time.perf_counter() - start) * 1000
+
+    variants = list(zip(VARIANT_NAMES, (
+        frame, enhanced_frame, sharpened_frame, brightness_contrast_frame, fire_detected_frame,
+    )))
+    return variants, timings
+
+
+class VariantBuffers:
+    """Output and scratch arrays for one frame size."""
+    __slots__ = ("shape", "lab", "lightness", "enhanced", "sharpened", "bright", "hsv", "mask", "mask2", "fire",
+                 "fire_coverage")
+
+    def __init__(self, shape):
+        height, width = shape[:2]
+        self.shape = shape
+        self.lab = np.empty((height, width, 3), np.uint8)
+        self.lightness = np.empty((height, width), np.uint8)
+        self.enhanced = np.empty((height, width, 3), np.uint8)
+        self.sharpened = np.empty((height, width, 3), np.uint8)
+        self.bright = np.empty((height, width, 3), np.uint8)
+        self.hsv = np.empty((height, width, 3), np.uint8)
+        self.mask = np.empty((height, width), np.uint8)
+        self.mask2 = np.empty((height, width), np.uint8)
+        self.fire = np.empty((height, width, 3), np.uint8)
+        # Son build çağrısında yangın maskesine düşen piksel oranı (hesaplanmadıysa None)
+        self.fire_coverage = None
+
+
+class VariantPreprocessor:
+    """Builds the upload variants with shared objects and pooled buffers.
+
+    The CLAHE object, sharpen kernel, HSV bounds and the brightness LUT are
+    created once. Every variant is written into preallocated arrays through
+    ``dst=``; the buffer sets are pooled per frame size, because the variants
+    stay alive until the (possibly batched) model call returns. ``build``
+    leases a set and ``release`` gives it back. The output is identical to
+    ``build_variants_reference``.
+    """
+
+    def __init__(self, max_sizes=8, max_free_per_size=4):
+        self.max_sizes = max_sizes
+        self.max_free_per_size = max_free_per_size
+        self.kernel = SHARPEN_KERNEL.astype(np.float32)
+        # convertScaleAbs'ın 256 girdilik tablosu: aynı yuvarlama, tek okuma geçişi
+        self.lut = cv2.convertScaleAbs(
+            np.arange(256, dtype=np.uint8).reshape(1, 256), alpha=BRIGHTNESS_ALPHA, beta=BRIGHTNESS_BETA
+        )
+        self.fire_ranges = [(lower.astype(np.uint8), upper.astype(np.uint8)) for lower, upper in FIRE_HSV_RANGES]
+        # CLAHE nesnesi iş parçacıkları arasında paylaşılamaz - iş parçacığı başına bir tane
+        self._local = threading.local()
+        self._pool = OrderedDict()  # şekil -> boştaki tampon setleri
+        self._lock = threading.Lock()
+        self.allocated = 0
+
+    def _clahe(self):
+        clahe = getattr(self._local, "clahe", None)
+        if clahe is None:
+            clahe = self._local.clahe = cv2.createCLAHE(clipLimit=CLAHE_CLIP_LIMIT, tileGridSize=CLAHE_TILE_GRID)
+        return clahe
+
+    def _acquire(self, shape):
+        with self._lock:
+            free = self._pool.get(shape)
+            if free:
+                self._pool.move_to_end(shape)
+                return free.pop()
+        self.allocated += 1
+        return VariantBuffers(shape)
+
+    def release(self, buffers):
+        """Return a buffer set once its variants are no longer used."""
+        if buffers is None:
+            return
+        with self._lock:
+            free = self._pool.setdefault(buffers.shape, [])
+            self._pool.move_to_end(buffers.shape)
+            if len(free) < self.max_free_per_size:
+                free.append(buffers)
+            # Yüklenen görüntülerin boyutu değişken - en eski boyutları unut
+            while len(self._pool) > self.max_sizes:
+                self._pool.popitem(last=False)
+
+    def build(self, frame, names=VARIANT_NAMES, min_fire_coverage=0.0):
+        """Return ``(variants, timings, buffers)``; pass ``buffers`` to ``release``.
+
+        Only the variants in ``names`` are built, in ``VARIANT_NAMES`` order.
+        The fire-masked variant is dropped when less than ``min_fire_coverage``
+        of the pixels fall in the fire mask (``buffers.fire_coverage``).
+        """
+        buffers = self._acquire(frame.shape)
+        buffers.fire_coverage = None
+        timings = {"preprocess_ms": {}}
+        preprocess_ms = timings["preprocess_ms"]
+        images = {}
+        if "Orijinal" in names:
+            images["Orijinal"] = frame
+            preprocess_ms["Orijinal"] = 0.0
+
+        # 1. CLAHE yalnızca L kanalında: kanal LAB tamponunun içinde değiştirilir,
+        # split/merge ara dizileri oluşmaz. Keskinleştirme de bu görüntüyü kullanır.
+        if "Geliştirilmiş" in names or "Keskinleştirilmiş" in names:
+            start = time.perf_counter()
+            cv2.cvtColor(frame, cv2.COLOR_BGR2LAB, dst=buffers.lab)
+            cv2.extractChannel(buffers.lab, 0, dst=buffers.lightness)
+            self._clahe().apply(buffers.lightness, dst=buffers.lightness)
+            cv2.insertChannel(buffers.lightness, buffers.lab, 0)
+            cv2.cvtColor(buffers.lab, cv2.COLOR_LAB2BGR, dst=buffers.enhanced)
+            preprocess_ms["Geliştirilmiş"] = (time.perf_counter() - start) * 1000
+            if "Geliştirilmiş" in names:
+                images["Geliştirilmiş"] = buffers.enhanced
+
+        # 2. Keskinleştirme
+        if "Keskinleştirilmiş" in names:
+            start = time.perf_counter()
+            cv2.filter2D(buffers.enhanced, -1, self.kernel, dst=buffers.sharpened)
+            preprocess_ms["Keskinleştirilmiş"] = (time.perf_counter() - start) * 1000
+            images["Keskinleştirilmiş"] = buffers.sharpened
+
+        # 3. Parlaklık + kontrast: tablo okuması
+        if "Parlaklık+Kontrast" in names:
+            start = time.perf_counter()
+            cv2.LUT(frame, self.lut, dst=buffers.bright)
+            preprocess_ms["Parlaklık+Kontrast"] = (time.perf_counter() - start) * 1000
+            images["Parlaklık+Kontrast"] = buffers.bright
+
+        # 4. Yangın maskesi
+        if "Yangın Maskeli" in names:
+            start = time.perf_counter()
+            cv2.cvtColor(frame, cv2.COLOR_BGR2HSV, dst=buffers.hsv)
+            (lower1, upper1), (lower2, upper2) = self.fire_ranges
+            cv2.inRange(buffers.hsv, lower1, upper1, dst=buffers.mask)
+            cv2.inRange(buffers.hsv, lower2, upper2, dst=buffers.mask2)
+            cv2.bitwise_or(buffers.mask, buffers.mask2, dst=buffers.mask)
+            buffers.fire_coverage = cv2.countNonZero(buffers.mask) / buffers.mask.size
+            # Ateş renginde piksel yoksa maskeli görüntü neredeyse tamamen siyah - model çağrısına değmez
+            if buffers.fire_coverage >= min_fire_coverage:
+                # Maske dışı pikseller sıfır olmalı; yeniden kullanılan tampon önce temizlenir
+                buffers.fire.fill(0)
+                cv2.copyTo(frame, buffers.mask, dst=buffers.fire)
+                images["Yangın Maskeli"] = buffers.fire
+            preprocess_ms["Yangın Maskeli"] = (time.perf_counter() - start) * 1000
+
+        variants = [(name, images[name]) for name in VARIANT_NAMES if name in images]
+        return variants, timings, buffers
+
+    def stats(self):
+        with self._lock:
+            pooled = sum(len(free) for free in self._pool.values())
+        return {"allocated_buffer_sets": self.allocated, "pooled_buffer_sets": pooled, "sizes": len(self._pool)}
@@ -0,0 +1,118 @@
+import base64
+import json
+import struct
+
+import numpy as np
+
+from preprocess import QUALITY_MODES
+
+# İkili kare başlığı: sürüm, mod, kalite, kare numarası, istemci zaman damgası (ms)
+# Başlığın hemen ardından ham JPEG/WebP baytları gelir.
+FRAME_HEADER = struct.Struct("<BBBIQ")
+PROTOCOL_VERSION = 2
+MODE_UPLOAD = 0
+MODE_WEBCAM = 1
+# Kalite baytı: 0 sunucu varsayılanı, sonrası QUALITY_MODES sırasıyla
+QUALITY_CODES = (None,) + QUALITY_MODES
+
+
+class FrameRequest:
+    """One frame received from a client, in either text or binary form.
+
+    ``payload`` is the base64 string of a text message or the whole binary
+    message. The image bytes are only materialized by ``image_buffer`` so the
+    base64 decode happens on the worker pool, not on the event loop.
+    ``quality`` is the upload quality mode requested by the client (``None``
+    uses the server default).
+    """
+    __slots__ = ("payload", "is_webcam", "frame_id", "timestamp", "binary", "quality")
+
+    def __init__(self, payload, is_webcam, frame_id=None, timestamp=None, binary=False, quality=None):
+        self.payload = payload
+        self.is_webcam = is_webcam
+        self.frame_id = frame_id
+        self.timestamp = timestamp
+        self.binary = binary
+        self.quality = quality
+
+    def image_buffer(self):
+        """Return the encoded image as a ``uint8`` array ready for ``cv2.imdecode``."""
+        if self.binary:
+            # Başlıktan sonrası doğrudan görünüm olarak kullanılır - kopya yok
+            return np.frombuffer(self.payload, np.uint8, offset=FRAME_HEADER.size)
+        return np.frombuffer(base64.b64decode(self.payload), np.uint8)
+
+    def echo_fields(self):
+        """Fields copied back into the response so clients can match frames."""
+        fields = {}
+        if self.frame_id is not None:
+            fields["frame_id"] = self.frame_id
+        if self.timestamp is not None:
+            fields["timestamp"] = self.timestamp
+        return fields
+
+
+class ControlMessage:
+    """A non-frame text message: ``encoding`` (result format) or ``ack``."""
+    __slots__ = ("kind", "data")
+
+    def __init__(self, kind, data):
+        self.kind = kind
+        self.data = data
+
+
+CONTROL_TYPES = ("encoding", "ack")
+
+
+def parse_text_message(message):
+    """Parse a JSON ``detect``/control message or a bare data URL string."""
+    try:
+        # Try to parse as JSON first (for new format)
+        data = json.loads(message)
+        if isinstance(data, dict) and data.get('type') in CONTROL_TYPES:
+            return ControlMessage(data['type'], data)
+        if isinstance(data, dict) and data.get('type') == 'detect':
+            # Extract base64 image from JSON message
+            return FrameRequest(
+                data['image'].split(",")[1],
+                data.get('mode') == 'webcam',  # Webcam modu kontrolü
+                frame_id=data.get('frame_id'),
+                timestamp=data.get('timestamp'),
+                quality=data.get('quality'),  # fast / balanced / full (yalnızca yüklemeler)
+            )
+        # Old format - direct base64 string
+        # Eski format için varsayılan olarak webcam değil
+        return FrameRequest(message.split(",")[1], False)
+    except json.JSONDecodeError:
+        # Old format - direct base64 string
+        # JSON olmayan mesajlar için varsayılan olarak webcam değil
+        return FrameRequest(message.split(",")[1], False)
+
+
+def parse_binary_message(data):
+    """Parse a binary frame: ``FRAME_HEADER`` followed by the raw image bytes.
+
+    The quality byte indexes ``QUALITY_CODES``; ``0`` uses the server default.
+    """
+    if len(data) <= FRAME_HEADER.size:
+        raise ValueError("Binary frame is too short")
+    version, mode, quality, frame_id, timestamp = FRAME_HEADER.unpack_from(data)
+    if version != PROTOCOL_VERSION:
+        raise ValueError(f"Unsupported binary protocol version: {version}")
+    if quality >= len(QUALITY_CODES):
+        raise ValueError(f"Unknown quality code: {quality}")
+    return FrameRequest(
+        data,
+        mode == MODE_WEBCAM,
+        frame_id=frame_id,
+        timestamp=timestamp,
+        binary=True,
+        quality=QUALITY_CODES[quality],
+    )
+
+
+def parse_message(message):
+    """Parse an ASGI ``websocket.receive`` message into a ``FrameRequest`` or ``ControlMessage``."""
+    if message.get("bytes") is not None:
+        return parse_binary_message(message["bytes"])
+    return parse_text_message(message["text"])
@@ -0,0 +1,130 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+
+class ResultCache:
+    """LRU cache of upload analysis results, keyed by image content.
+
+    Entries are stored as serialized JSON so the byte bound is exact and
+    every hit returns a fresh copy the caller may modify. The cache is
+    bounded by ``max_entries`` and ``max_bytes``; the least recently used
+    entries are evicted first. With ``directory`` every entry is also
+    written to disk, so the cache survives restarts: files found at startup
+    are indexed (oldest first) and only read on their first hit.
+    """
+
+    def __init__(self, max_entries=256, max_bytes=32 * 1024 * 1024, directory=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self._entries = OrderedDict()  # key -> (size, JSON bytes or None if only on disk)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.disk_hits = 0
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._load_index()
+
+    @staticmethod
+    def make_key(image, model_identity, config):
+        """Hash of the decoded image pixels, the model file and the thresholds."""
+        digest = hashlib.sha256()
+        digest.update(str(image.shape).encode())
+        digest.update(image.tobytes())
+        digest.update(model_identity.encode())
+        digest.update(json.dumps(config, sort_keys=True, default=str).encode())
+        return digest.hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load_index(self):
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".json"):
+                path = os.path.join(self.directory, name)
+                files.append((os.path.getmtime(path), name[:-5], os.path.getsize(path)))
+        for _, key, size in sorted(files):
+            self._entries[key] = (size, None)
+            self._bytes += size
+        self._evict()
+
+    def get(self, key):
+        """Return a copy of the cached value, or ``None`` on a miss."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            size, data = entry
+            if data is None:
+                try:
+                    with open(self._path(key), "rb") as f:
+                        data = f.read()
+                except OSError:
+                    # Dosya dışarıdan silinmiş - kaydı unut
+                    del self._entries[key]
+                    self._bytes -= size
+                    self.misses += 1
+                    return None
+                self._entries[key] = (size, data)
+                self.disk_hits += 1
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return json.loads(data)
+
+    def put(self, key, value):
+        data = json.dumps(value).encode()
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)[0]
+            self._entries[key] = (len(data), data)
+            self._bytes += len(data)
+            if self.directory:
+                self._write(key, data)
+            self._evict()
+
+    def _write(self, key, data):
+        # Yarım yazılmış dosya kalmasın diye önce geçici dosyaya yaz
+        tmp_path = self._path(key) + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(key))
+        except OSError as e:
+            print(f"Sonuç önbelleği diske yazılamadı: {e}")
+
+    def _evict(self):
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            key, (size, _) = self._entries.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+            if self.directory:
+                try:
+                    os.remove(self._path(key))
+                except OSError:
+                    pass
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_entries": self.max_entries,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "disk_hits": self.disk_hits,
+            "evictions": self.evictions,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
@@ -0,0 +1,151 @@
+import json
+from collections import OrderedDict
+
+try:
+    import msgpack
+except ImportError:  # İsteğe bağlı - yoksa kompakt sonuçlar JSON olarak gönderilir
+    msgpack = None
+
+# Kompakt tespit satırının alanları (istemciye şema mesajıyla bildirilir)
+ROW_FIELDS = ("track_id", "class_id", "x1", "y1", "x2", "y2", "confidence_permille", "flags",
+              "danger_level", "danger_source", "time_in_danger_ds", "hazards_in_range")
+HAZARD_FIELDS = ("class_id", "level", "distance", "track_id")
+LEVELS = ("low", "medium", "high")
+FLAG_IN_DANGER = 1
+FLAG_SAFETY_EQUIPMENT = 2
+# Sınıf olmayan tehlike kaynağı (Kasksiz/Yeleksiz işaretlemesi)
+SOURCE_EQUIPMENT = -1
+# Tam yanıtta olup kompakt zarfa alınmayan alanlar (hareket kapısı istatistikleri /stats'ta)
+DROPPED_FIELDS = ("status", "message", "detections", "motion_gate")
+# Yalnızca değiştiklerinde gönderilen alanlar; yoksa istemci son değeri kullanır
+STICKY_FIELDS = ("dropped_frames",)
+
+
+class ResultEncoder:
+    """Per-connection opt-in compact and delta encoding of result messages.
+
+    A client opts in with an ``encoding`` control message and gets a schema
+    message back. Each detection then becomes a positional row
+    (``ROW_FIELDS``): class IDs from ``ALL_CLASSES`` instead of names,
+    integer pixel coordinates, confidence in permille and the flags packed
+    into one integer; the variant ``source`` is left out. Messages carry a
+    ``seq`` number and are MessagePack binary frames when ``msgpack`` is
+    installed and requested, compact JSON text otherwise.
+
+    In delta mode a message lists only the rows that were added (``add``),
+    changed (``upd``) or removed (``del``, track IDs) since the frame
+    ``base``, the newest ``seq`` the client acknowledged with an ``ack``
+    message. The client keeps the state of that frame and of the frames
+    sent after it. Without an acknowledged base, or when a detection has
+    no track ID, the full row list is sent as ``detections``.
+
+    Per-frame diagnostics are kept out of compact messages: ``motion_gate``
+    is dropped and ``STICKY_FIELDS`` are only sent when their value changed.
+    Full and delta message counts are added to the shared ``totals`` dict.
+    """
+
+    def __init__(self, class_ids, history=64, totals=None):
+        # Model yüklenince ALL_CLASSES değişebilir - her kodlamada yeniden okunur
+        self.class_ids = class_ids
+        self.history = history
+        self.enabled = False
+        self.delta = False
+        self.binary = False
+        self.seq = 0
+        self.sent = OrderedDict()  # seq -> {track_id: satır}, onay bekleyen kareler
+        self.base = None           # (seq, {track_id: satır}) - istemcinin onayladığı son kare
+        self.sticky = {}           # STICKY_FIELDS alanlarının son gönderilen değerleri
+        self.totals = totals if totals is not None else {"full_messages": 0, "delta_messages": 0}
+
+    def configure(self, options):
+        """Apply an ``encoding`` control message and return the schema reply."""
+        self.enabled = options.get("compact", True) is not False
+        self.delta = bool(options.get("delta", False))
+        self.binary = options.get("format") == "msgpack" and msgpack is not None
+        self.sent.clear()
+        self.base = None
+        self.sticky.clear()
+        return {
+            "type": "encoding",
+            "compact": self.enabled,
+            "delta": self.delta,
+            "format": "msgpack" if self.binary else "json",
+            "fields": ROW_FIELDS,
+            "hazard_fields": HAZARD_FIELDS,
+            "levels": LEVELS,
+            "flags": {"in_danger": FLAG_IN_DANGER, "safety_equipment": FLAG_SAFETY_EQUIPMENT},
+            "classes": {idx: name for name, idx in self.class_ids().items()},
+            "equipment_source": SOURCE_EQUIPMENT,
+            "sticky_fields": STICKY_FIELDS,
+        }
+
+    def ack(self, seq):
+        """The client applied message ``seq``; it becomes the base of the next deltas."""
+        rows = self.sent.get(seq)
+        if rows is None:
+            return
+        self.base = (seq, rows)
+        while self.sent and next(iter(self.sent)) <= seq:
+            self.sent.popitem(last=False)
+
+    def _row(self, detection, class_ids):
+        box = detection["box"]
+        flags = (FLAG_IN_DANGER if detection.get("in_danger") else 0) | \
+                (FLAG_SAFETY_EQUIPMENT if detection.get("safety_equipment") else 0)
+        level = detection.get("danger_level")
+        source = detection.get("danger_source")
+        time_in_danger = detection.get("time_in_danger")
+        return [
+            detection.get("track_id", -1),
+            class_ids.get(detection["class"], -1),
+            round(box[0]), round(box[1]), round(box[2]), round(box[3]),
+            round(detection["confidence"] * 1000),
+            flags,
+            LEVELS.index(level) if level in LEVELS else None,
+            class_ids.get(source, SOURCE_EQUIPMENT) if source is not None else None,
+            round(time_in_danger * 10) if time_in_danger is not None else None,
+            [[class_ids.get(h["class"], -1), LEVELS.index(h["level"]) if h["level"] in LEVELS else None,
+              round(h["distance"]), h.get("track_id", -1)]
+             for h in detection.get("hazards_in_range", ())],
+        ]
+
+    def encode(self, response):
+        """Encoded message for a successful ``response``, or ``None`` to send it as plain JSON."""
+        if not self.enabled or response.get("status") != "success":
+            return None
+        class_ids = self.class_ids()
+        rows = [self._row(d, class_ids) for d in response["detections"]]
+        self.seq += 1
+        message = {k: v for k, v in response.items() if k not in DROPPED_FIELDS}
+        for field in STICKY_FIELDS:
+            if field not in message:
+                continue
+            if field in self.sticky and self.sticky[field] == message[field]:
+                del message[field]
+            else:
+                self.sticky[field] = message[field]
+        message["seq"] = self.seq
+
+        tracked = all(row[0] >= 0 for row in rows)
+        current = {row[0]: row for row in rows} if tracked else None
+        if self.delta and tracked and self.base is not None:
+            base_seq, base_rows = self.base
+            message["base"] = base_seq
+            message["add"] = [row for track_id, row in current.items() if track_id not in base_rows]
+            message["upd"] = [row for track_id, row in current.items()
+                              if track_id in base_rows and base_rows[track_id] != row]
+            message["del"] = [track_id for track_id in base_rows if track_id not in current]
+            self.totals["delta_messages"] += 1
+        else:
+            message["detections"] = rows
+            self.totals["full_messages"] += 1
+
+        if self.delta and tracked:
+            self.sent[self.seq] = current
+            # Onaylanmayan eski kareler unutulur; onayları artık taban olamaz
+            while len(self.sent) > self.history:
+                self.sent.popitem(last=False)
+
+        if self.binary:
+            return msgpack.packb(message, use_bin_type=True)
+        return json.dumps(message, separators=(",", ":"))
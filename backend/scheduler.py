@@ -0,0 +1,181 @@
+import asyncio
+import time
+from collections import deque
+
+import numpy as np
+
+
+class _Job:
+    __slots__ = ("images", "future", "enqueued_at")
+
+    def __init__(self, images, future):
+        self.images = images
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class BatchScheduler:
+    """Collect frames from all connections into micro-batches.
+
+    Every connection submits its images (one webcam frame or the upload
+    variants) and awaits the results. A single collector task groups pending
+    jobs until ``max_batch_size`` images are queued or the oldest job has
+    waited ``max_wait_ms``, then runs the whole group through ``infer_fn`` in
+    one call on ``executor``. A job is never split across batches.
+
+    ``latency_budget_ms`` bounds the end-to-end time of a job: the collector
+    flushes early when the oldest job's age plus the estimated batch time
+    would exceed it.
+    """
+
+    def __init__(self, infer_fn, executor, max_batch_size=8, max_wait_ms=5.0,
+                 latency_budget_ms=None, max_inflight=1, history=1000):
+        self.infer_fn = infer_fn
+        self.executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000
+        self.latency_budget = latency_budget_ms / 1000 if latency_budget_ms else None
+        self.max_inflight = max(1, max_inflight)
+        self._inflight = None
+        self._loop = None
+        self._queue = None
+        self._carry = None
+        self._getter = None
+        self._task = None
+        # Görüntü başına tahmini çıkarım süresi (saniye) - üstel ortalama
+        self._per_image_cost = 0.0
+
+        self.batches = 0
+        self.images = 0
+        self.jobs = 0
+        self.errors = 0
+        self.latencies = deque(maxlen=history)
+        self.batch_sizes = deque(maxlen=history)
+
+    def _ensure_started(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._loop is not loop:
+            self._loop = loop
+            self._inflight = asyncio.Semaphore(self.max_inflight)
+            self._queue = asyncio.Queue()
+            self._carry = None
+            self._getter = None
+            self._task = loop.create_task(self._collect())
+
+    async def submit(self, images):
+        """Queue ``images`` for the next micro-batch and return their results."""
+        self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        job = _Job(list(images), future)
+        await self._queue.put(job)
+        results = await future
+        self.latencies.append(time.perf_counter() - job.enqueued_at)
+        return results
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._getter is not None:
+            self._getter.cancel()
+            self._getter = None
+
+    def _deadline(self, oldest):
+        deadline = oldest.enqueued_at + self.max_wait
+        if self.latency_budget is not None:
+            estimated = self._per_image_cost * self.max_batch_size
+            deadline = min(deadline, oldest.enqueued_at + self.latency_budget - estimated)
+        return deadline
+
+    async def _next_job(self, timeout=None):
+        if self._carry is not None:
+            job, self._carry = self._carry, None
+            return job
+        # Bekleyen get() görevi zaman aşımında iptal edilmez, böylece kuyruktan
+        # alınmış bir iş kaybolmaz
+        if self._getter is None:
+            self._getter = asyncio.get_running_loop().create_task(self._queue.get())
+        done, _ = await asyncio.wait({self._getter}, timeout=timeout)
+        if not done:
+            raise asyncio.TimeoutError
+        job = self._getter.result()
+        self._getter = None
+        return job
+
+    async def _collect(self):
+        while True:
+            first = await self._next_job()
+            batch = [first]
+            size = len(first.images)
+            deadline = self._deadline(first)
+
+            while size < self.max_batch_size:
+                timeout = deadline - time.perf_counter()
+                if timeout <= 0:
+                    break
+                try:
+                    job = await self._next_job(timeout)
+                except asyncio.TimeoutError:
+                    break
+                if size + len(job.images) > self.max_batch_size:
+                    # Sığmayan iş bir sonraki partiye kalır
+                    self._carry = job
+                    break
+                batch.append(job)
+                size += len(job.images)
+
+            await self._inflight.acquire()
+            asyncio.get_running_loop().create_task(self._run(batch))
+
+    async def _run(self, batch):
+        try:
+            images = [image for job in batch for image in job.images]
+            start = time.perf_counter()
+            try:
+                results = await asyncio.get_running_loop().run_in_executor(
+                    self.executor, self.infer_fn, images
+                )
+            except Exception as e:
+                self.errors += 1
+                for job in batch:
+                    if not job.future.done():
+                        job.future.set_exception(e)
+                return
+
+            elapsed = time.perf_counter() - start
+            cost = elapsed / len(images)
+            self._per_image_cost = cost if self.batches == 0 else 0.8 * self._per_image_cost + 0.2 * cost
+            self.batches += 1
+            self.images += len(images)
+            self.jobs += len(batch)
+            self.batch_sizes.append(len(images))
+
+            # Sonuçları gönderen bağlantılara geri dağıt
+            offset = 0
+            for job in batch:
+                count = len(job.images)
+                if not job.future.done():
+                    job.future.set_result(list(results[offset:offset + count]))
+                offset += count
+        finally:
+            self._inflight.release()
+
+    def stats(self):
+        latencies_ms = np.array(self.latencies) * 1000 if self.latencies else None
+        return {
+            "batches": self.batches,
+            "images": self.images,
+            "jobs": self.jobs,
+            "errors": self.errors,
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait * 1000,
+            "latency_budget_ms": self.latency_budget * 1000 if self.latency_budget else None,
+            "mean_batch_size": float(np.mean(self.batch_sizes)) if self.batch_sizes else 0.0,
+            "per_image_ms": self._per_image_cost * 1000,
+            "latency_p50_ms": float(np.percentile(latencies_ms, 50)) if latencies_ms is not None else None,
+            "latency_p99_ms": float(np.percentile(latencies_ms, 99)) if latencies_ms is not None else None,
+        }
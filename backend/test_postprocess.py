@@ -0,0 +1,92 @@
+import copy
+import random
+
+import numpy as np
+import pytest
+
+import main
+from postprocess import boxes_overlap, gap_distance, pairwise_iou
+
+CLASSES = list(main.ALL_CLASSES)
+VARIANTS = ["Orijinal", "Geliştirilmiş", "Keskinleştirilmiş", "Parlaklık+Kontrast", "Yangın Maskeli"]
+
+
+def random_box(rng, size=640):
+    x1, y1 = rng.uniform(0, size - 20), rng.uniform(0, size - 20)
+    return [x1, y1, x1 + rng.uniform(1, 200), y1 + rng.uniform(1, 200)]
+
+
+def degenerate_boxes(rng, box):
+    """Boxes touching ``box`` on an edge or a corner, and zero-area boxes on and near it."""
+    x1, y1, x2, y2 = box
+    width = rng.uniform(1, 80)
+    return [
+        [x2, y1, x2 + width, y2],                # sağ kenara değen
+        [x1, y2, x2, y2 + width],                # alt kenara değen
+        [x2, y2, x2 + width, y2 + width],        # köşeye değen
+        [x1, y1, x1, y2],                        # sıfır genişlik
+        [x1, y1, x2, y1],                        # sıfır yükseklik
+        [x2 + 5, y2 + 5, x2 + 5, y2 + 5],        # nokta
+        list(box),                               # birebir aynı kutu
+    ]
+
+
+def scene(rng, count):
+    """Raw ``(box, conf, class_name, source)`` detections with clustered duplicates."""
+    raw = []
+    # Sıfır alanlı kutusu olan sınıflar (insanlar sınıftan bağımsız karşılaştırılır)
+    flat_classes = set()
+    while len(raw) < count:
+        box = random_box(rng)
+        class_name = rng.choice(CLASSES)
+        raw.append((box, rng.uniform(0.0, 1.0), class_name, rng.choice(VARIANTS)))
+        # Aynı nesnenin diğer varyantlardaki hafifçe kaymış kopyaları
+        for _ in range(rng.randint(0, 3)):
+            x1, y1, x2, y2 = [v + rng.uniform(-15, 15) for v in box]
+            # Model kutuları her zaman x1 <= x2, y1 <= y2
+            jitter = [min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)]
+            raw.append((jitter, rng.uniform(0.0, 1.0), class_name, rng.choice(VARIANTS)))
+        if rng.random() < 0.3:
+            for other in degenerate_boxes(rng, box):
+                classes = CLASSES
+                if other[0] == other[2] or other[1] == other[3]:
+                    # İki sıfır alanlı kutunun IoU'su referansta 0/0 - motor 0 sayar; karşılaştırılmaz
+                    classes = [c for c in CLASSES if c not in flat_classes]
+                    if not classes:
+                        continue
+                class_name = rng.choice(classes)
+                if other[0] == other[2] or other[1] == other[3]:
+                    flat_classes.update(main.HUMAN_CLASSES if class_name in main.HUMAN_CLASSES else {class_name})
+                raw.append((other, rng.uniform(0.0, 1.0), class_name, rng.choice(VARIANTS)))
+    return raw
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_engine_matches_reference(seed):
+    rng = random.Random(seed)
+    for _ in range(50):
+        raw = scene(rng, rng.randint(0, 40))
+        reference = main.merge_detections_reference(copy.deepcopy(raw), 0.25)
+        merged = main.postprocessor.merge(copy.deepcopy(raw), 0.25)
+        assert merged == reference
+        assert main.postprocessor.assess(merged) == main.assess_dangers_reference(reference)
+
+
+def test_degenerate_pairs_match_scalar_helpers():
+    rng = random.Random(0)
+    boxes = [random_box(rng) for _ in range(5)]
+    boxes += [b for box in boxes for b in degenerate_boxes(rng, box)]
+    array = np.array(boxes, dtype=np.float64)
+    iou = pairwise_iou(array, array)
+    distance = gap_distance(array[:, None], array[None])
+    overlap = boxes_overlap(array[:, None], array[None])
+    for i, a in enumerate(boxes):
+        for j, b in enumerate(boxes):
+            try:
+                assert iou[i, j] == pytest.approx(main.calculate_iou(a, b))
+            except ZeroDivisionError:
+                # İki sıfır alanlı kutu: motor çakışma saymaz
+                assert iou[i, j] == 0.0
+            assert distance[i, j] == pytest.approx(main.calculate_distance(a, b))
+            # Değen ve sıfır alanlı kutular çakışma sayılmaz
+            assert overlap[i, j] == (max(a[0], b[0]) < min(a[2], b[2]) and max(a[1], b[1]) < min(a[3], b[3]))
@@ -0,0 +1,81 @@
+import copy
+
+from postprocess import DetectionPostProcessor
+from tracker import StreamTracker
+
+HAZARD_CLASSES = {'cukur': {'level': 'high', 'distance_threshold': 100, 'conf_threshold': 0.08}}
+HUMAN_CLASSES = {'insan', 'Kaskli', 'Kasksiz', 'Yelekli', 'Yeleksiz'}
+HUMAN_PRIORITY = {'Kasksiz': 1, 'Yeleksiz': 2, 'Kaskli': 3, 'Yelekli': 4, 'insan': 5}
+
+
+def detection(class_name, box):
+    return {"box": list(box), "confidence": 0.9, "class": class_name,
+            "in_danger": class_name in HAZARD_CLASSES,
+            "danger_level": HAZARD_CLASSES.get(class_name, {}).get('level'),
+            "safety_equipment": False, "source": "Orijinal"}
+
+
+def run_frame(postprocessor, tracker, detections, now):
+    tracker.update(detections, now)
+    cached = postprocessor.assess(copy.deepcopy(detections), tracker=tracker)
+    fresh = postprocessor.assess(copy.deepcopy(detections))
+    return cached, fresh
+
+
+def humans(detections):
+    return [(d.get("in_danger", False), d.get("danger_source")) for d in detections if d["class"] in HUMAN_CLASSES]
+
+
+def test_hazard_moving_while_human_is_missed_invalidates_cache():
+    postprocessor = DetectionPostProcessor(HAZARD_CLASSES, {}, HUMAN_CLASSES, HUMAN_PRIORITY)
+    tracker = StreamTracker()
+    human = (30, 100, 70, 200)
+    now = 0.0
+
+    for _ in range(3):
+        now += 0.1
+        cached, fresh = run_frame(postprocessor, tracker,
+                                  [detection('insan', human), detection('cukur', (190, 100, 330, 220))], now)
+    assert humans(cached) == humans(fresh) == [(False, None)]
+
+    # İnsan görünmezken çukur izi menzile kayar; bu karelerde tehlike kontrolü yapılmaz
+    for _ in range(tracker.max_misses):
+        now += 0.1
+        run_frame(postprocessor, tracker, [detection('cukur', (150, 100, 290, 220))], now)
+
+    for _ in range(3):
+        now += 0.1
+        cached, fresh = run_frame(postprocessor, tracker,
+                                  [detection('insan', human), detection('cukur', (150, 100, 290, 220))], now)
+        assert humans(fresh) == [(True, 'cukur')]
+        assert humans(cached) == humans(fresh)
+
+
+def test_static_scene_reuses_cached_danger():
+    postprocessor = DetectionPostProcessor(HAZARD_CLASSES, {}, HUMAN_CLASSES, HUMAN_PRIORITY)
+    tracker = StreamTracker()
+    detections = [detection('insan', (30, 100, 70, 200)), detection('cukur', (120, 120, 190, 180))]
+    run_frame(postprocessor, tracker, detections, 0.1)
+    cached, fresh = run_frame(postprocessor, tracker, detections, 0.2)
+    assert humans(cached) == humans(fresh) == [(True, 'cukur')]
+
+
+def test_slow_approach_is_rechecked():
+    postprocessor = DetectionPostProcessor(HAZARD_CLASSES, {}, HUMAN_CLASSES, HUMAN_PRIORITY)
+    tracker = StreamTracker()
+    hazard = (400, 100, 470, 180)
+    step = 1.5
+    flagged = {"cached": None, "fresh": None}
+    # Kare başına tolerans altında kalan adımlarla tehlikeye yaklaşan işçi
+    for frame in range(200):
+        x = 30 + frame * step
+        cached, fresh = run_frame(postprocessor, tracker,
+                                  [detection('insan', (x, 100, x + 40, 200)), detection('cukur', hazard)],
+                                  frame * 0.1)
+        for name, result in (("cached", cached), ("fresh", fresh)):
+            if flagged[name] is None and humans(result) == [(True, 'cukur')]:
+                flagged[name] = frame
+    assert flagged["fresh"] is not None
+    # Önbellek en fazla static_tolerance kadar geride kalabilir
+    assert flagged["cached"] is not None
+    assert flagged["cached"] - flagged["fresh"] <= tracker.static_tolerance / step + 1
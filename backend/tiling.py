@@ -0,0 +1,97 @@
+import numpy as np
+
+from backends import DetectionResult
+
+
+class TilePlanner:
+    """Second, native-resolution look at the regions around humans and hazards.
+
+    Frames are shrunk to 640 on the longest side before inference, which
+    makes distant workers on wide cameras only a few pixels tall. After the
+    640 pass, ``plan`` places up to ``budget`` tiles of ``tile_size`` native
+    pixels around the detected humans (smallest first, they gain the most)
+    and then hazards; a region already inside a tile gets no new one, and
+    regions larger than a tile are skipped since they are well resolved at
+    640. All tiles have the same size so they run as one batch; ``merge``
+    maps their boxes back into the 640 frame coordinates and drops boxes cut
+    by an inner tile edge, which the neighbouring view sees whole.
+    """
+
+    def __init__(self, human_classes, hazard_classes, tile_size=640, budget=4, edge_margin=2):
+        self.human_classes = set(human_classes)
+        self.hazard_classes = set(hazard_classes)
+        self.tile_size = tile_size
+        self.budget = budget
+        self.edge_margin = edge_margin
+
+    def regions(self, results_list, scale_x, scale_y):
+        """Human and hazard boxes of the 640 pass in native coordinates, in tiling order."""
+        regions = []
+        for _, result in results_list:
+            for x1, y1, x2, y2, _, cls in result.boxes.data.tolist():
+                class_name = result.names.get(int(cls), "unknown")
+                if class_name in self.human_classes:
+                    priority = 0
+                elif class_name in self.hazard_classes:
+                    priority = 1
+                else:
+                    continue
+                box = (x1 / scale_x, y1 / scale_y, x2 / scale_x, y2 / scale_y)
+                regions.append((priority, (box[2] - box[0]) * (box[3] - box[1]), box))
+        regions.sort(key=lambda region: region[:2])
+        return [box for _, _, box in regions]
+
+    def plan(self, results_list, frame_shape, native_shape):
+        """``(x, y, width, height)`` native-resolution tiles, at most ``budget``."""
+        native_height, native_width = native_shape[:2]
+        scale_x = frame_shape[1] / native_width
+        scale_y = frame_shape[0] / native_height
+        width = min(self.tile_size, native_width)
+        height = min(self.tile_size, native_height)
+
+        tiles = []
+        for x1, y1, x2, y2 in self.regions(results_list, scale_x, scale_y):
+            if len(tiles) >= self.budget:
+                break
+            if x2 - x1 > width or y2 - y1 > height:
+                continue
+            if any(tx <= x1 and ty <= y1 and x2 <= tx + width and y2 <= ty + height for tx, ty, _, _ in tiles):
+                continue
+            # Bölge ortada, karo görüntü sınırları içinde kalacak şekilde kaydırılır
+            tx = int(min(max((x1 + x2 - width) / 2, 0), native_width - width))
+            ty = int(min(max((y1 + y2 - height) / 2, 0), native_height - height))
+            tiles.append((tx, ty, width, height))
+        return tiles
+
+    @staticmethod
+    def crop(native, tiles):
+        return [np.ascontiguousarray(native[y:y + height, x:x + width]) for x, y, width, height in tiles]
+
+    def merge(self, results, tiles, frame_shape, native_shape):
+        """One ``DetectionResult`` with the boxes of all tiles in 640 frame coordinates."""
+        native_height, native_width = native_shape[:2]
+        scale = np.array([frame_shape[1] / native_width, frame_shape[0] / native_height] * 2)
+        rows = []
+        names = {}
+        for result, (x, y, width, height) in zip(results, tiles):
+            names = names or result.names
+            data = result.boxes.data
+            data = np.asarray(data.cpu() if hasattr(data, "cpu") else data, dtype=np.float64).reshape(-1, 6)
+            if not len(data):
+                continue
+            margin = self.edge_margin
+            # Karo kenarında kesilen kutular: kenar görüntünün kenarı değilse atılır
+            cut = np.zeros(len(data), dtype=bool)
+            if x > 0:
+                cut |= data[:, 0] <= margin
+            if y > 0:
+                cut |= data[:, 1] <= margin
+            if x + width < native_width:
+                cut |= data[:, 2] >= width - margin
+            if y + height < native_height:
+                cut |= data[:, 3] >= height - margin
+            data = data[~cut]
+            data[:, :4] = (data[:, :4] + (x, y, x, y)) * scale
+            rows.append(data)
+        data = np.concatenate(rows) if rows else np.zeros((0, 6))
+        return DetectionResult(data, names, {})
@@ -0,0 +1,262 @@
+import numpy as np
+
+from postprocess import pairwise_iou
+
+
+class StreamTracker:
+    """Per-connection multi-object tracker with array-backed track state.
+
+    Detections are associated with existing tracks of the same class by IoU,
+    falling back to centroid distance for small or fast-moving boxes. Each
+    track keeps a ring buffer of its last ``history_length`` boxes; the
+    reported box is their mean. Tracks that go unmatched for more than
+    ``max_misses`` frames are dropped.
+
+    All per-track state lives in preallocated NumPy arrays (rows
+    ``[0, count)`` are live), so a frame costs a few vectorized operations
+    instead of rebuilding a dict of deques.
+    """
+
+    def __init__(self, history_length=5, iou_threshold=0.3, max_centroid_distance=40.0,
+                 max_misses=5, static_tolerance=2.0, max_gap=1.0, capacity=32):
+        self.history_length = history_length
+        self.iou_threshold = iou_threshold
+        self.max_centroid_distance = max_centroid_distance
+        self.max_misses = max_misses
+        # Bu kadar pikselden az kayan izler tehlike kontrolü için "değişmemiş" sayılır
+        self.static_tolerance = static_tolerance
+        # Kareler arası bundan uzun boşluklar (bağlantı koptu vb.) tehlike süresine eklenmez
+        self.max_gap = max_gap
+
+        self.count = 0
+        self.next_id = 1
+        self.class_names = []
+        self._class_index = {}
+        self.level_names = []
+        self._allocate(capacity)
+
+        # Önbellekteki tehlike sonuçlarının hesaplandığı tehlike kutuları: iz kimliği -> kutu
+        self._checked_hazard_boxes = None
+        # DetectionPostProcessor'ın tehlike ızgarası - sabit tehlikeler kareler arası yerinde kalır
+        self.hazard_grid = None
+
+    def _allocate(self, capacity):
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.class_ids = np.zeros(capacity, dtype=np.int16)
+        self.history = np.zeros((capacity, self.history_length, 4), dtype=np.float32)
+        self.history_size = np.zeros(capacity, dtype=np.int8)
+        self.history_pos = np.zeros(capacity, dtype=np.int8)
+        self.boxes = np.zeros((capacity, 4), dtype=np.float32)
+        self.age = np.zeros(capacity, dtype=np.int32)
+        self.misses = np.zeros(capacity, dtype=np.int16)
+        self.last_seen = np.zeros(capacity, dtype=np.float64)
+        # Önceki eşleşmeden bu yana geçen süre (saniye)
+        self.elapsed = np.zeros(capacity, dtype=np.float32)
+        self.danger_time = np.zeros(capacity, dtype=np.float32)
+        # Önbelleğe alınmış tehlike sonucu: seviye kodu ve kaynak sınıfı (-1 = yok)
+        self.danger_level = np.full(capacity, -1, dtype=np.int8)
+        self.danger_source = np.full(capacity, -1, dtype=np.int16)
+        self.danger_checked = np.zeros(capacity, dtype=bool)
+        # Önbellekteki sonucun hesaplandığı kutu - kayma buna göre ölçülür, önceki kareye göre değil
+        self.danger_box = np.zeros((capacity, 4), dtype=np.float32)
+        # Menzildeki tüm tehlikelerin listesi (yanıttaki "hazards_in_range")
+        self.danger_hazards = np.empty(capacity, dtype=object)
+
+    def _grow(self, needed):
+        capacity = len(self.ids)
+        if needed <= capacity:
+            return
+        old = {name: getattr(self, name) for name in self._arrays}
+        self._allocate(max(needed, capacity * 2))
+        for name, values in old.items():
+            getattr(self, name)[:self.count] = values[:self.count]
+
+    _arrays = ("ids", "class_ids", "history", "history_size", "history_pos", "boxes", "age",
+               "misses", "last_seen", "elapsed", "danger_time", "danger_level", "danger_source",
+               "danger_checked", "danger_box", "danger_hazards")
+
+    def _class_id(self, class_name):
+        if class_name not in self._class_index:
+            self._class_index[class_name] = len(self.class_names)
+            self.class_names.append(class_name)
+        return self._class_index[class_name]
+
+    def _match(self, det_boxes, det_classes):
+        """Greedy one-to-one matching of detections to live tracks."""
+        count = self.count
+        if count == 0 or len(det_boxes) == 0:
+            return []
+
+        track_boxes = self.boxes[:count].astype(np.float64)
+        same_class = self.class_ids[:count, None] == det_classes[None, :]
+        iou = pairwise_iou(track_boxes, det_boxes)
+
+        track_centres = (track_boxes[:, :2] + track_boxes[:, 2:]) / 2
+        det_centres = (det_boxes[:, :2] + det_boxes[:, 2:]) / 2
+        distance = np.linalg.norm(track_centres[:, None, :] - det_centres[None, :, :], axis=2)
+
+        # IoU eşleşmeleri önce gelir; merkez mesafesi yalnızca yedek ölçüt
+        score = np.where(iou >= self.iou_threshold, 1.0 + iou,
+                         np.where(distance < self.max_centroid_distance,
+                                  1.0 - distance / self.max_centroid_distance, 0.0))
+        score[~same_class] = 0.0
+
+        rows, cols = np.nonzero(score > 0)
+        order = np.argsort(-score[rows, cols], kind="stable")
+        matches = []
+        used_tracks = set()
+        used_dets = set()
+        for row, col in zip(rows[order].tolist(), cols[order].tolist()):
+            if row in used_tracks or col in used_dets:
+                continue
+            used_tracks.add(row)
+            used_dets.add(col)
+            matches.append((row, col))
+        return matches
+
+    def update(self, detections, now):
+        """Associate ``detections`` with tracks and smooth their boxes in place.
+
+        Each detection dict gets a ``track_id`` and its ``box`` replaced by the
+        track's smoothed box.
+        """
+        det_boxes = np.array([d["box"] for d in detections], dtype=np.float64).reshape(-1, 4)
+        det_classes = np.array([self._class_id(d["class"]) for d in detections], dtype=np.int16)
+
+        matches = self._match(det_boxes, det_classes)
+        matched_rows = np.zeros(self.count, dtype=bool)
+        det_rows = np.full(len(detections), -1, dtype=np.intp)
+        for row, col in matches:
+            matched_rows[row] = True
+            det_rows[col] = row
+
+        # Eşleşmeyen izler: kaçırma sayısını artır, fazla kaçıranları sil
+        self.misses[:self.count][~matched_rows] += 1
+        self.age[:self.count] += 1
+        keep = self.misses[:self.count] <= self.max_misses
+        if not keep.all():
+            remap = np.cumsum(keep) - 1
+            det_rows = np.where(det_rows >= 0, remap[np.maximum(det_rows, 0)], -1)
+            kept = np.flatnonzero(keep)
+            for name in self._arrays:
+                values = getattr(self, name)
+                values[:len(kept)] = values[kept]
+            self.count = len(kept)
+
+        # Yeni izler
+        new = np.flatnonzero(det_rows < 0)
+        self._grow(self.count + len(new))
+        for col in new.tolist():
+            row = self.count
+            self.count += 1
+            self.ids[row] = self.next_id
+            self.next_id += 1
+            self.class_ids[row] = det_classes[col]
+            self.history_size[row] = 0
+            self.history_pos[row] = 0
+            self.age[row] = 0
+            self.danger_time[row] = 0.0
+            self.danger_level[row] = -1
+            self.danger_source[row] = -1
+            self.danger_checked[row] = False
+            self.danger_hazards[row] = None
+            self.boxes[row] = det_boxes[col]
+            det_rows[col] = row
+
+        if len(detections) == 0:
+            return
+
+        # Geçmişe ekle ve ortalamayı al - tüm eşleşen izler için tek seferde
+        rows = det_rows
+        pos = self.history_pos[rows].astype(np.intp)
+        self.history[rows, pos] = det_boxes
+        self.history_pos[rows] = (pos + 1) % self.history_length
+        self.history_size[rows] = np.minimum(self.history_size[rows] + 1, self.history_length)
+        sizes = self.history_size[rows].astype(np.float32)
+        filled = np.arange(self.history_length)[None, :] < sizes[:, None]
+        smoothed = (self.history[rows] * filled[:, :, None]).sum(axis=1) / sizes[:, None]
+
+        self.elapsed[rows] = np.where(self.age[rows] > 0,
+                                      np.minimum(now - self.last_seen[rows], self.max_gap), 0.0)
+        self.last_seen[rows] = now
+
+        self.boxes[rows] = smoothed
+        self.misses[rows] = 0
+
+        for detection, row, box in zip(detections, rows.tolist(), smoothed.tolist()):
+            detection["box"] = box
+            detection["track_id"] = int(self.ids[row])
+
+    def _rows_for(self, track_ids):
+        index = {int(track_id): row for row, track_id in enumerate(self.ids[:self.count].tolist())}
+        return np.array([index.get(track_id, -1) for track_id in track_ids], dtype=np.intp)
+
+    def hazards_changed(self, hazard_track_ids):
+        """True when the hazards differ from those the cached danger results were computed with.
+
+        The boxes are compared with the snapshot taken at the last change,
+        not with the previous frame: a hazard that moves while no human is
+        checked (frames without humans) still invalidates the cache.
+        """
+        rows = self._rows_for(hazard_track_ids)
+        last = self._checked_hazard_boxes
+        changed = last is None or bool((rows < 0).any()) or set(hazard_track_ids) != set(last)
+        if not changed and len(rows):
+            previous = np.array([last[track_id] for track_id in hazard_track_ids], dtype=np.float32)
+            changed = bool((np.abs(self.boxes[rows] - previous) > self.static_tolerance).any())
+        if changed:
+            self._checked_hazard_boxes = {track_id: self.boxes[row].copy()
+                                          for track_id, row in zip(hazard_track_ids, rows.tolist())}
+        return changed
+
+    def stale_rows(self, track_ids, hazards_changed):
+        """Rows of the humans that need a fresh danger check (``-1`` = untracked).
+
+        A track is stale when its box drifted more than ``static_tolerance``
+        from the box its cached result was computed with, so slow movement
+        accumulates over frames instead of being compared frame to frame.
+        """
+        rows = self._rows_for(track_ids)
+        if hazards_changed:
+            return rows, np.ones(len(rows), dtype=bool)
+        safe = np.maximum(rows, 0)
+        shift = np.abs(self.boxes[safe] - self.danger_box[safe]).max(axis=1)
+        stale = (rows < 0) | ~self.danger_checked[safe] | (shift > self.static_tolerance)
+        return rows, stale
+
+    def cached_danger(self, row):
+        """Cached ``(level, source, hazards)`` of a track, or ``None`` if no hazard was in range."""
+        if self.danger_source[row] < 0:
+            return None
+        return (self.level_names[self.danger_level[row]], self.class_names[self.danger_source[row]],
+                self.danger_hazards[row])
+
+    def store_danger(self, row, level, source_class, hazards=None):
+        """Remember the hazard check result of a track (``None`` = no hazard in range)."""
+        self.danger_checked[row] = True
+        self.danger_box[row] = self.boxes[row]
+        self.danger_hazards[row] = hazards
+        if source_class is None:
+            self.danger_level[row] = -1
+            self.danger_source[row] = -1
+            return
+        if level not in self.level_names:
+            self.level_names.append(level)
+        self.danger_level[row] = self.level_names.index(level)
+        self.danger_source[row] = self._class_id(source_class)
+
+    def record_danger_time(self, detections):
+        """Accumulate per-track time in danger and report it on the detections."""
+        tracked = [d for d in detections if "track_id" in d]
+        rows = self._rows_for([d["track_id"] for d in tracked])
+        for detection, row in zip(tracked, rows.tolist()):
+            if row < 0:
+                continue
+            if detection.get("in_danger"):
+                self.danger_time[row] += self.elapsed[row]
+            detection["time_in_danger"] = round(float(self.danger_time[row]), 2)
+
+    @property
+    def nbytes(self):
+        """Memory used by the track arrays."""
+        return sum(getattr(self, name).nbytes for name in self._arrays)
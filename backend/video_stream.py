@@ -0,0 +1,201 @@
+import asyncio
+import os
+import threading
+import time
+
+import cv2
+
+
+class Subscription:
+    """A viewer's mailbox: holds only the newest published message."""
+    __slots__ = ("message", "dropped", "_ready")
+
+    def __init__(self):
+        self.message = None
+        self.dropped = 0
+        self._ready = asyncio.Event()
+
+    def put(self, message):
+        if self.message is not None:
+            # Yavaş izleyici: eski sonucu at, yayını bekletme
+            self.dropped += 1
+        self.message = message
+        self._ready.set()
+
+    async def get(self):
+        while self.message is None:
+            self._ready.clear()
+            await self._ready.wait()
+        message, self.message = self.message, None
+        return message
+
+
+class VideoStream:
+    """A server-side video source whose results are shared by all its viewers.
+
+    The pipeline has three stages, each keeping only the newest item so a
+    slow stage drops frames instead of building latency:
+
+    1. a capture thread reads and decodes frames with ``cv2.VideoCapture``
+       (local files are paced to their frame rate; streams reconnect after
+       ``reconnect_seconds``);
+    2. one processing task awaits ``process(frame, timings, frame_id,
+       timestamp)`` on the newest frame - resize, inference and danger
+       analysis - which returns the message to publish, serialized once;
+    3. the message is handed to every ``Subscription``.
+
+    The stream starts with its first viewer and stops after the last one
+    leaves, so N viewers cost one decode and one inference stream.
+    """
+
+    def __init__(self, stream_id, source, process, loop_file=True, reconnect_seconds=2.0, on_restart=None):
+        self.stream_id = stream_id
+        # Sayısal kaynak yerel kamera dizinidir
+        self.source = int(source) if str(source).isdigit() else source
+        self.process = process
+        self.is_file = isinstance(self.source, str) and os.path.exists(self.source)
+        self.loop_file = loop_file
+        self.reconnect_seconds = reconnect_seconds
+        # Kaynak (yeniden) açıldıktan sonraki ilk kare işlenmeden önce çağrılır
+        self.on_restart = on_restart
+
+        self.subscribers = set()
+        self._loop = None
+        self._task = None
+        self._thread = None
+        self._stop = None
+        self._latest = None
+        self._frame_ready = None
+
+        self.frame_id = 0
+        self.decoded_frames = 0
+        self.dropped_frames = 0
+        self.processed_frames = 0
+        self.errors = 0
+        self.last_error = None
+        self.fps = 0.0
+
+    # Abonelik
+
+    def subscribe(self):
+        subscription = Subscription()
+        self.subscribers.add(subscription)
+        if self._task is None:
+            self._start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscribers.discard(subscription)
+        if not self.subscribers:
+            self.stop()
+
+    # Yaşam döngüsü
+
+    def _start(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop = threading.Event()
+        self._frame_ready = asyncio.Event()
+        self._latest = None
+        self._thread = threading.Thread(
+            target=self._capture, args=(self._stop,), name=f"capture-{self.stream_id}", daemon=True
+        )
+        self._thread.start()
+        self._task = self._loop.create_task(self._process_frames())
+
+    def stop(self):
+        if self._task is None:
+            return
+        # Yakalama iş parçacığı bir sonraki karede durur
+        self._stop.set()
+        self._task.cancel()
+        self._task = None
+        self._thread = None
+
+    # 1. aşama: yakalama ve kod çözme
+
+    def _capture(self, stop):
+        while not stop.is_set():
+            capture = cv2.VideoCapture(self.source)
+            if not capture.isOpened():
+                self.last_error = f"Video kaynağı açılamadı: {self.stream_id}"
+                print(self.last_error)
+                stop.wait(self.reconnect_seconds)
+                continue
+
+            fps = capture.get(cv2.CAP_PROP_FPS) or 0.0
+            self.fps = fps
+            # Dosyalar gerçek zaman hızında oynatılır; canlı yayınlarda read() zaten bekler
+            interval = 1.0 / fps if self.is_file and fps > 0 else 0.0
+            next_frame = time.monotonic()
+            restarted = True
+            while not stop.is_set():
+                start = time.perf_counter()
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                decode_ms = (time.perf_counter() - start) * 1000
+                self.decoded_frames += 1
+                try:
+                    self._loop.call_soon_threadsafe(self._set_latest, frame, decode_ms, restarted)
+                except RuntimeError:
+                    # Olay döngüsü kapandı (sunucu duruyor)
+                    stop.set()
+                    break
+                restarted = False
+                if interval:
+                    next_frame += interval
+                    stop.wait(max(0.0, next_frame - time.monotonic()))
+            capture.release()
+
+            if self.is_file and not self.loop_file:
+                break
+            if not self.is_file and not stop.is_set():
+                self.last_error = f"Video akışı kesildi, yeniden bağlanılıyor: {self.stream_id}"
+                print(self.last_error)
+                stop.wait(self.reconnect_seconds)
+
+    def _set_latest(self, frame, decode_ms, restarted=False):
+        if self._latest is not None:
+            self.dropped_frames += 1
+            # Atlanan kare yeniden bağlanmanın ilk karesiyse işaret sonrakine geçer
+            restarted = restarted or self._latest[4]
+        self.frame_id += 1
+        self._latest = (frame, self.frame_id, time.time(), decode_ms, restarted)
+        self._frame_ready.set()
+
+    # 2. ve 3. aşama: işleme ve yayın
+
+    async def _process_frames(self):
+        while True:
+            while self._latest is None:
+                self._frame_ready.clear()
+                await self._frame_ready.wait()
+            frame, frame_id, timestamp, decode_ms, restarted = self._latest
+            self._latest = None
+            if restarted and self.on_restart is not None:
+                self.on_restart()
+            try:
+                message = await self.process(frame, {"decode_ms": decode_ms}, frame_id, timestamp)
+                self.processed_frames += 1
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+                print(f"Video işleme hatası ({self.stream_id}): {e}")
+                continue
+            for subscription in self.subscribers:
+                subscription.put(message)
+
+    def stats(self):
+        return {
+            # Akış adresleri parola içerebilir - yalnızca türü gösterilir
+            "kind": "file" if self.is_file else "camera" if isinstance(self.source, int) else "stream",
+            "running": self._task is not None,
+            "viewers": len(self.subscribers),
+            "fps": self.fps,
+            "decoded_frames": self.decoded_frames,
+            "processed_frames": self.processed_frames,
+            "dropped_frames": self.dropped_frames,
+            "viewer_dropped_frames": sum(s.dropped for s in self.subscribers),
+            "errors": self.errors,
+            "last_error": self.last_error,
+        }